@@ -3,26 +3,2237 @@
 Leaflow 多账号自动签到脚本
 变量名：LEAFLOW_ACCOUNTS
 变量值：邮箱1:密码1,邮箱2:密码2,邮箱3:密码3
+LEAFLOW_ACCOUNTS_FILE：账号文件路径，JSONL 或 CSV，每个账号可单独设置 priority、proxy、timeout（优先于 LEAFLOW_ACCOUNTS）
+  （timeout 为该账号每个等待步骤和每次HTTP请求的超时秒数，两种模式下都代替各步骤的固定值，仍按历史耗时自适应调整；
+   账号整体的硬性超时仍由 LEAFLOW_ACCOUNT_TIMEOUT 控制）
+LEAFLOW_ACCOUNTS_KEY：账号文件以 .enc 结尾时用于解密的 Fernet 密钥
+LEAFLOW_ACCOUNTS_WINDOW：账号文件每次读取并按 priority 排序的行数（默认 256）
+LEAFLOW_CONCURRENCY：同时处理的账号数（默认 1，串行）
+LEAFLOW_MEMORY_BUDGET_MB：浏览器会话可用的内存上限，并发数在 1 和 LEAFLOW_CONCURRENCY 之间按实测内存自动调整（可选，默认只按系统可用内存调整）
+LEAFLOW_DRIVER_POOL：是否复用浏览器实例（默认 1，设为 0 则每个账号单独启动）
+LEAFLOW_DRIVER_MAX_USES：单个浏览器实例最多复用次数（默认 20）
+LEAFLOW_STATE_DIR：本地状态目录（默认 .leaflow_state）
+LEAFLOW_SESSION_CACHE：是否缓存登录状态（默认 1）
+LEAFLOW_SESSION_TTL：登录状态缓存有效期，单位秒（默认 3 天）
+LEAFLOW_SESSION_KEY：登录状态缓存加密密钥（可选，默认由账号密码派生）
+LEAFLOW_STEP_TIMEOUT：没有单独固定超时的等待（页面就绪、CDP 命令等）的默认期限，单位秒（默认 20，账号设置了 timeout 时使用账号的值）
+LEAFLOW_HTTP_FAST_PATH：是否先尝试不启动浏览器的HTTP签到（默认 1）
+LEAFLOW_HEADLESS：是否使用无头模式（默认 1）
+LEAFLOW_LEAN：精简模式，拦截图片、字体、媒体和第三方脚本（默认 1）
+LEAFLOW_BLOCK_PATTERNS：额外拦截的URL规则，逗号分隔（如 *.svg,*cdn.example.com*）
+LEAFLOW_BASE_URL / LEAFLOW_CHECKIN_URL：站点地址（默认 https://leaflow.net 和 https://checkin.leaflow.net）
+LEAFLOW_NETWORK_CAPTURE：从页面请求的接口响应中读取签到结果和余额，读到时跳过仪表板页面（默认 1）
+LEAFLOW_MODE：执行模式，thread（默认，Selenium）或 async（单事件循环通过 CDP 并发处理）
+LEAFLOW_ACCOUNT_TIMEOUT：单个账号的硬性超时时间，超时后结束该账号的浏览器进程，单位秒（默认 300）
+LEAFLOW_CHROME_BINARY：Chrome 可执行文件路径（可选，默认自动查找）
+LEAFLOW_CHROMEDRIVER：chromedriver 可执行文件路径（可选，默认自动查找）
+LEAFLOW_DRIVER_CACHE：把查找到的 Chrome 和 chromedriver 路径缓存到状态目录的 driver_paths.json，后续启动跳过查找（默认 1）
+LEAFLOW_PROFILE_TEMPLATE：预先生成一份已完成首次启动并关闭弹窗的浏览器配置模板，每个浏览器实例复制一份使用（默认 1，模板 7 天后重新生成）
+LEAFLOW_SKIP_CHECKED_IN：跳过当天已签到成功的账号（默认 1，记录保存在状态目录的 checkins.db）
+LEAFLOW_TIMEZONE：判断“当天”所用的时区（默认 Asia/Shanghai）
+LEAFLOW_ADAPTIVE_TIMEOUT：按历史耗时的 p99 自动调整各等待步骤的超时，最多放宽到固定值的 3 倍（默认 1，重试时使用固定超时）
+LEAFLOW_RATE_LIMIT：所有账号共享的登录/签到速率上限，每分钟次数（默认 60，0 为不限速）
+LEAFLOW_RATE_BURST：速率限制允许的突发次数（默认 10）
+LEAFLOW_RETRY_BUDGET：失败账号的最大重试次数（默认 2）
+LEAFLOW_RETRY_BASE_DELAY：重试的基础退避时间，单位秒（默认 10，每次翻倍并加随机抖动）
+LEAFLOW_NOTIFY_EACH：每个账号完成后单独发送一条Telegram通知（默认 0，汇总通知照常发送）
+LEAFLOW_RESULTS_JSONL：每个账号完成后追加写入结果的 JSON Lines 路径，设为 - 写到标准输出（可选）
+LEAFLOW_NOTIFY_TIMEOUT：退出前等待Telegram通知发送的最长时间，单位秒（默认 30）
+LEAFLOW_PROFILE：开启页面性能剖析，采集 Performance.getMetrics 和导航/资源计时（默认 0）
+LEAFLOW_PROFILE_TRACE：性能剖析时同时录制完整的 Chrome trace（默认 0，开销较大）
+LEAFLOW_PROFILE_THRESHOLD_MS：只保存加载时间超过该值的页面，单位毫秒（默认 3000）
+LEAFLOW_PROFILE_KEEP：状态目录 profiles 下最多保留的性能数据文件数（默认 20）
+LEAFLOW_METRICS_JSONL：阶段耗时明细的 JSON Lines 输出路径（可选）
+LEAFLOW_METRICS_PROM：阶段耗时汇总的 Prometheus textfile 输出路径（可选）
+
+命令行参数：
+--shard i/N：只处理按邮箱哈希分到第 i 片（共 N 片）的账号，结果写入 leaflow-results-i-of-N.jsonl
+merge 文件...：合并各分片的结果文件，发送一条汇总通知
+enqueue：把账号写入工作队列（sqlite，LEAFLOW_QUEUE_DB，默认状态目录中的 queue.db）
+worker [--lease 秒]：从工作队列领取账号签到并写回结果，可在多个进程或共享队列文件的多台机器上同时运行
+  （处理中的账号定期续租；worker 总是使用线程模式，LEAFLOW_MODE=async 对 worker 无效）
+report：汇总工作队列中的结果，发送一条汇总通知
 """
 
 import os
+import sys
+import socket
+import signal
+import glob
+import argparse
+import re
+import math
+import random
+import shutil
+import asyncio
+import tempfile
 import time
+import json
+import html
+import base64
+import gzip
+import sqlite3
+import csv
+import io
+import hashlib
 import logging
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.action_chains import ActionChains
+import queue
+import threading
+import functools
+import itertools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 站点地址可通过环境变量指向本地测试站点（见 benchmark.py）
+LEAFLOW_BASE_URL = os.getenv('LEAFLOW_BASE_URL', 'https://leaflow.net').rstrip('/')
+LEAFLOW_CHECKIN_URL = os.getenv('LEAFLOW_CHECKIN_URL', 'https://checkin.leaflow.net').rstrip('/')
+
+# 主站主机名，签到子站的Cookie也挂在这个域名下
+LEAFLOW_HOSTNAME = urlsplit(LEAFLOW_BASE_URL).hostname
+
+# 需要在复用浏览器前清理数据的站点
+LEAFLOW_ORIGINS = list(dict.fromkeys(
+    f"{parts.scheme}://{parts.netloc}" for parts in map(urlsplit, [LEAFLOW_BASE_URL, LEAFLOW_CHECKIN_URL])
+))
+
+def account_hash(email):
+    """账号的哈希标识，避免在本地文件和日志中暴露邮箱"""
+    return hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()[:16]
+
+def mask_email(email):
+    """隐藏邮箱部分字符以保护隐私"""
+    return email[:3] + "***" + email[email.find("@"):]
+
+def shard_of(email, total):
+    """按邮箱的稳定哈希分片，返回 1 到 total 之间的分片号"""
+    return int(account_hash(email.strip().lower()), 16) % total + 1
+
+def parse_shard(value):
+    """解析 --shard i/N 参数"""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', value or '')
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError(f"分片格式应为 i/N 且 1 <= i <= N: {value}")
+    return int(match.group(1)), int(match.group(2))
+
+def get_int_env(name, default):
+    """读取正整数类型的环境变量，格式错误时使用默认值"""
+    value = os.getenv(name, '').strip()
+    if not value:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(f"{name} 格式错误: {value}，使用默认值 {default}")
+        return default
+
+def get_state_dir():
+    """本地状态目录，可在CI中缓存"""
+    path = os.getenv('LEAFLOW_STATE_DIR', '.leaflow_state')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# Selenium 在第一次需要浏览器时才导入（见 load_selenium），HTTP快速通道、merge、report 等不启动浏览器的路径不付出导入开销
+webdriver = By = WebDriverWait = EC = Options = ActionBuilder = Service = None
+
+class TimeoutException(Exception):
+    """导入 Selenium 之前的占位，load_selenium 后替换为 Selenium 的 TimeoutException"""
+
+_selenium_lock = threading.Lock()
+
+def load_selenium():
+    """导入 Selenium 并绑定到模块级名称，只在第一次调用时真正导入"""
+    global webdriver, By, WebDriverWait, EC, Options, ActionBuilder, Service, TimeoutException
+    if webdriver is not None:
+        return
+    with _selenium_lock:
+        if webdriver is not None:
+            return
+        from selenium import webdriver as selenium_webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.common.actions.action_builder import ActionBuilder
+        from selenium.common.exceptions import TimeoutException
+        # 最后绑定 webdriver，其他线程看到它不为 None 时其余名称都已可用
+        webdriver = selenium_webdriver
+
+CHROME_NAMES = ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome')
+
+_driver_paths = None
+_driver_paths_lock = threading.Lock()
+
+def driver_cache_enabled():
+    """是否缓存 Chrome 和 chromedriver 的路径"""
+    return os.getenv('LEAFLOW_DRIVER_CACHE', '1').strip() != '0'
+
+def is_executable(path):
+    return bool(path) and os.path.isfile(path) and os.access(path, os.X_OK)
+
+def file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+def locate_chromedriver():
+    """在 PATH 中查找 chromedriver，找不到时尝试 webdriver-manager 下载与 Chrome 匹配的版本"""
+    path = shutil.which('chromedriver')
+    if path:
+        return path
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+    except ImportError:
+        return None
+    try:
+        return ChromeDriverManager().install()
+    except Exception as e:
+        logger.warning(f"webdriver-manager 获取 chromedriver 失败: {e}")
+        return None
+
+def resolve_driver_paths():
+    """返回 {'chrome': 路径, 'chromedriver': 路径}，找不到的项为 None（交给 Selenium Manager 处理）"""
+    global _driver_paths
+    if _driver_paths is not None:
+        return _driver_paths
+    with _driver_paths_lock:
+        if _driver_paths is not None:
+            return _driver_paths
+        
+        chrome = os.getenv('LEAFLOW_CHROME_BINARY', '').strip() or None
+        chromedriver = os.getenv('LEAFLOW_CHROMEDRIVER', '').strip() or None
+        cache_file = os.path.join(get_state_dir(), 'driver_paths.json')
+        cached = {}
+        if driver_cache_enabled():
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = {}
+        
+        # Chrome 升级后可执行文件的修改时间会变化，此时重新查找匹配的 chromedriver
+        chrome = chrome or next(filter(None, map(shutil.which, CHROME_NAMES)), None)
+        if (
+            chromedriver is None
+            and cached.get('chrome') == chrome
+            and cached.get('chrome_mtime') == file_mtime(chrome)
+            and is_executable(cached.get('chromedriver'))
+        ):
+            chromedriver = cached['chromedriver']
+            logger.debug(f"使用缓存的 chromedriver 路径: {chromedriver}")
+        if chromedriver is None:
+            chromedriver = locate_chromedriver()
+            if driver_cache_enabled() and chromedriver:
+                try:
+                    with open(cache_file, 'w', encoding='utf-8') as f:
+                        json.dump({'chrome': chrome, 'chrome_mtime': file_mtime(chrome), 'chromedriver': chromedriver}, f)
+                except OSError as e:
+                    logger.warning(f"写入驱动路径缓存失败: {e}")
+        
+        _driver_paths = {'chrome': chrome, 'chromedriver': chromedriver}
+        return _driver_paths
+
+# 精简模式下拦截的资源：图片、字体、媒体和第三方统计脚本
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*hm.baidu.com*", "*cnzz.com*", "*clarity.ms*", "*hotjar.com*", "*connect.facebook.net*"
+]
+
+def lean_mode_enabled():
+    return os.getenv('LEAFLOW_LEAN', '1').strip() != '0'
+
+def lean_blocked_urls():
+    """默认拦截列表加上 LEAFLOW_BLOCK_PATTERNS 中的自定义规则"""
+    extra = [p.strip() for p in os.getenv('LEAFLOW_BLOCK_PATTERNS', '').split(',') if p.strip()]
+    return LEAN_BLOCKED_URLS + extra
+
+def build_chrome_options(proxy=None):
+    """构建Chrome驱动选项"""
+    load_selenium()
+    chrome_options = Options()
+    if proxy:
+        chrome_options.add_argument(f'--proxy-server={proxy}')
+    
+    # 默认在所有环境使用新版无头模式
+    if os.getenv('LEAFLOW_HEADLESS', '1').strip() != '0':
+        chrome_options.add_argument('--headless=new')
+    chrome_options.add_argument('--window-size=1920,1080')
+    
+    # GitHub Actions环境配置
+    if os.getenv('GITHUB_ACTIONS'):
+        chrome_options.add_argument('--no-sandbox')
+        chrome_options.add_argument('--disable-dev-shm-usage')
+        chrome_options.add_argument('--disable-gpu')
+    
+    # 精简模式：关闭用不到的浏览器功能，不加载图片和通知等内容
+    if lean_mode_enabled():
+        for argument in [
+            '--blink-settings=imagesEnabled=false',
+            '--disable-extensions',
+            '--disable-background-networking',
+            '--disable-component-update',
+            '--disable-default-apps',
+            '--disable-sync',
+            '--disable-features=Translate,MediaRouter,OptimizationHints',
+            '--autoplay-policy=user-gesture-required',
+            '--mute-audio',
+            '--no-first-run'
+        ]:
+            chrome_options.add_argument(argument)
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.default_content_setting_values.notifications': 2,
+            'profile.default_content_setting_values.media_stream': 2,
+            'profile.default_content_setting_values.geolocation': 2
+        })
+    
+    # 性能日志中包含 Network 事件，用于直接读取接口响应；性能剖析时还包含 trace 事件
+    if network_capture_enabled() or profiling_enabled():
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    if trace_enabled():
+        chrome_options.add_experimental_option('perfLoggingPrefs', {
+            'enableNetwork': True,
+            'traceCategories': TRACE_CATEGORIES
+        })
+    
+    # 通用配置
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    return chrome_options
+
+PROFILE_TEMPLATE_TTL = 7 * 86400
+
+# 复制配置模板时跳过的锁文件、端口文件和缓存目录
+PROFILE_TEMPLATE_SKIP = (
+    'Singleton*', 'DevToolsActivePort', 'lockfile', '*.tmp',
+    'Cache', 'Code Cache', 'GPUCache', 'ShaderCache', 'GrShaderCache', 'GraphiteDawnCache',
+    'Crashpad', 'component_crx_cache', 'Service Worker'
+)
+
+_profile_template_lock = threading.Lock()
+_profile_template_failed = False
+
+# 本地存储的全部键值，用来确认关闭弹窗的状态确实写入了存储
+LOCAL_STORAGE_SCRIPT = """
+    var items = {};
+    for (var i = 0; i < localStorage.length; i++) {
+        var key = localStorage.key(i);
+        items[key] = localStorage.getItem(key);
+    }
+    return items;
+"""
+
+def profile_template_enabled():
+    """是否使用预先生成的浏览器配置模板"""
+    return os.getenv('LEAFLOW_PROFILE_TEMPLATE', '1').strip() != '0'
+
+def profile_template_dir():
+    return os.path.join(get_state_dir(), 'chrome-profile')
+
+def profile_template_ready(path):
+    """模板存在且未超过有效期"""
+    built = file_mtime(os.path.join(path, '.leaflow-template'))
+    return built is not None and time.time() - built < PROFILE_TEMPLATE_TTL
+
+@contextlib.contextmanager
+def profile_template_lock(exclusive):
+    """模板的跨进程文件锁：生成时独占，复制时共享，共用状态目录的多个 worker 不会在复制途中替换模板"""
+    with _profile_template_lock if exclusive else contextlib.nullcontext():
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(get_state_dir(), 'chrome-profile.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def launch_chrome(options):
+    """使用缓存的 Chrome 和 chromedriver 路径启动浏览器"""
+    paths = resolve_driver_paths()
+    if paths['chrome']:
+        options.binary_location = paths['chrome']
+    service = Service(executable_path=paths['chromedriver']) if paths['chromedriver'] else Service()
+    
+    # chromedriver 进程一启动就登记到看门狗，Chrome 启动或新建会话卡住时也能在期限到达后被结束
+    spawn = service._start_process
+    
+    def start_process(path):
+        spawn(path)
+        watchdog.attach_pid(service.process.pid)
+    
+    service._start_process = start_process
+    return webdriver.Chrome(options=options, service=service)
+
+def build_profile_template(path):
+    """完整启动一次浏览器生成配置模板：完成首次运行的初始化，并在登录页关闭弹窗。
+    调用方需持有独占的模板锁"""
+    building = tempfile.mkdtemp(prefix='chrome-profile-', dir=get_state_dir())
+    try:
+        options = build_chrome_options()
+        options.add_argument(f'--user-data-dir={building}')
+        driver = launch_chrome(options)
+        try:
+            driver.get(f"{LEAFLOW_BASE_URL}/login")
+            waiter = WaitEngine(driver, 15)
+            waiter.page_ready(idle_ms=300)
+            before = driver.execute_script(LOCAL_STORAGE_SCRIPT) or {}
+            actions = ActionBuilder(driver)
+            actions.pointer_action.move_to_location(10, 10).click()
+            mark = waiter.mark()
+            actions.perform()
+            waiter.settled_since(mark, timeout=3, idle_ms=300)
+            
+            # 清除所有域名的 Cookie，不让各账号共用同一个未登录会话，只保留本地存储中的页面状态
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            after = driver.execute_script(LOCAL_STORAGE_SCRIPT) or {}
+            popup_keys = sorted(key for key, value in after.items() if before.get(key) != value)
+        finally:
+            driver.quit()
+        
+        if popup_keys:
+            logger.info(f"弹窗关闭状态已保存在本地存储: {', '.join(popup_keys)}")
+        else:
+            logger.warning("关闭弹窗后本地存储没有变化，模板只包含首次启动的初始化，登录时仍会关闭弹窗")
+        with open(os.path.join(building, '.leaflow-template'), 'w') as f:
+            json.dump({'built': datetime.now().isoformat(), 'popup_keys': popup_keys}, f)
+        
+        # 先把旧模板移开再换入新模板，最后删除旧模板
+        retired = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, retired)
+        os.rename(building, path)
+        shutil.rmtree(retired, ignore_errors=True)
+        logger.info("已生成浏览器配置模板")
+    finally:
+        shutil.rmtree(building, ignore_errors=True)
+
+def clone_profile_template():
+    """复制一份配置模板给新浏览器使用，模板不可用时返回 None（由 Chrome 创建空配置）"""
+    global _profile_template_failed
+    if not profile_template_enabled() or _profile_template_failed:
+        return None
+    path = profile_template_dir()
+    if not profile_template_ready(path):
+        with profile_template_lock(exclusive=True):
+            # 等锁期间其他线程或进程可能已经生成
+            if not profile_template_ready(path):
+                try:
+                    build_profile_template(path)
+                except Exception as e:
+                    # 生成失败时本次运行不再重试，直接使用空配置
+                    _profile_template_failed = True
+                    logger.warning(f"生成浏览器配置模板失败，使用空配置: {e}")
+                    return None
+    
+    with profile_template_lock(exclusive=False):
+        if not profile_template_ready(path):
+            return None
+        clone = tempfile.mkdtemp(prefix='leaflow-chrome-')
+        try:
+            shutil.copytree(path, clone, dirs_exist_ok=True, ignore=shutil.ignore_patterns(*PROFILE_TEMPLATE_SKIP))
+            return clone
+        except (OSError, shutil.Error) as e:
+            logger.warning(f"复制浏览器配置模板失败: {e}")
+            shutil.rmtree(clone, ignore_errors=True)
+            return None
+
+def create_chrome_driver(proxy=None):
+    """启动一个新的Chrome实例"""
+    options = build_chrome_options(proxy)
+    profile_dir = clone_profile_template()
+    if profile_dir:
+        options.add_argument(f'--user-data-dir={profile_dir}')
+    try:
+        driver = launch_chrome(options)
+    except Exception:
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        raise
+    driver.leaflow_profile_dir = profile_dir
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    
+    if lean_mode_enabled():
+        try:
+            # 通过CDP在网络层拦截字体、媒体和第三方脚本
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": lean_blocked_urls()})
+        except Exception as e:
+            logger.warning(f"设置资源拦截失败: {e}")
+    return driver
+
+def quit_driver(driver):
+    """关闭浏览器并删除它使用的配置副本"""
+    try:
+        driver.quit()
+    finally:
+        profile_dir = getattr(driver, 'leaflow_profile_dir', None)
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+class PageLoadStats:
+    """页面加载统计 - 汇总每次页面加载的耗时、传输量和资源数"""
+    
+    # 读取 Navigation/Resource Timing 和JS堆内存
+    _SCRIPT = """
+        var nav = performance.getEntriesByType('navigation')[0];
+        var resources = performance.getEntriesByType('resource');
+        var bytes = nav ? nav.transferSize : 0;
+        for (var i = 0; i < resources.length; i++) bytes += resources[i].transferSize || 0;
+        return {
+            loadMs: nav ? nav.duration : 0,
+            bytes: bytes,
+            resources: resources.length,
+            heap: performance.memory ? performance.memory.usedJSHeapSize : 0
+        };
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = {}
+    
+    def collect(self, driver, page):
+        """读取当前页面的加载数据"""
+        try:
+            stats = driver.execute_script(self._SCRIPT)
+        except Exception as e:
+            logger.debug(f"读取页面加载数据失败: {e}")
+            return
+        if not stats:
+            return
+        with self._lock:
+            total = self._pages.setdefault(page, {'count': 0, 'loadMs': 0.0, 'bytes': 0, 'resources': 0, 'heap': 0})
+            total['count'] += 1
+            for key in ('loadMs', 'bytes', 'resources', 'heap'):
+                total[key] += stats.get(key) or 0
+    
+    def report(self):
+        """输出各页面的平均加载数据"""
+        with self._lock:
+            pages = dict(self._pages)
+        if not pages:
+            return
+        mode = "精简模式" if lean_mode_enabled() else "完整模式"
+        logger.info(f"页面加载统计（{mode}，可设置 LEAFLOW_LEAN=0 对比）:")
+        for page, total in pages.items():
+            count = total['count']
+            logger.info(
+                f"  {page}: {count} 次, 平均耗时 {total['loadMs'] / count:.0f}ms, "
+                f"平均传输 {total['bytes'] / count / 1024:.1f}KB, 平均资源数 {total['resources'] / count:.0f}, "
+                f"平均JS堆 {total['heap'] / count / 1024 / 1024:.1f}MB"
+            )
+
+page_stats = PageLoadStats()
+
+class RunMetrics:
+    """阶段耗时统计 - 按阶段和账号哈希记录耗时，运行结束后导出 JSON Lines 和 Prometheus 文本"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = []
+    
+    @contextlib.contextmanager
+    def span(self, phase, account=None, **tags):
+        """记录代码块的耗时，异常时标记为失败；代码块内可把产出的记录的 ok 设为 False"""
+        started_at = time.time()
+        start = time.perf_counter()
+        record = {'phase': phase, 'account': account, 'start': round(started_at, 3), 'ok': True}
+        try:
+            yield record
+        except BaseException:
+            record['ok'] = False
+            raise
+        finally:
+            record['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            record.update(tags)
+            with self._lock:
+                self._spans.append(record)
+    
+    @staticmethod
+    def percentile(values, pct):
+        """最近秩法计算百分位数"""
+        ordered = sorted(values)
+        index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+        return ordered[index]
+    
+    def summary(self):
+        """按阶段汇总次数、失败次数、p50、p95 和总耗时（毫秒）"""
+        with self._lock:
+            spans = list(self._spans)
+        durations = {}
+        failures = {}
+        for record in spans:
+            durations.setdefault(record['phase'], []).append(record['duration_ms'])
+            if not record['ok']:
+                failures[record['phase']] = failures.get(record['phase'], 0) + 1
+        return {
+            phase: {
+                'count': len(values),
+                'failures': failures.get(phase, 0),
+                'p50': self.percentile(values, 50),
+                'p95': self.percentile(values, 95),
+                'sum': round(sum(values), 1)
+            }
+            for phase, values in durations.items()
+        }
+    
+    def report(self):
+        """输出汇总日志，并按环境变量导出到文件"""
+        summary = self.summary()
+        if not summary:
+            return
+        logger.info("阶段耗时统计 (ms):")
+        for phase, stats in sorted(summary.items(), key=lambda item: -item[1]['sum']):
+            logger.info(f"  {phase}: 次数 {stats['count']}, 失败 {stats['failures']}, p50 {stats['p50']:.0f}, p95 {stats['p95']:.0f}, 合计 {stats['sum']:.0f}")
+        
+        jsonl_path = os.getenv('LEAFLOW_METRICS_JSONL', '').strip()
+        if jsonl_path:
+            self.export_jsonl(jsonl_path)
+        prom_path = os.getenv('LEAFLOW_METRICS_PROM', '').strip()
+        if prom_path:
+            self.export_prometheus(prom_path, summary)
+    
+    def export_jsonl(self, path):
+        """把每个耗时记录追加写入 JSON Lines 文件"""
+        with self._lock:
+            spans = list(self._spans)
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                for record in spans:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            logger.info(f"耗时明细已写入 {path}")
+        except OSError as e:
+            logger.warning(f"写入耗时明细失败: {e}")
+    
+    def export_prometheus(self, path, summary=None):
+        """写入 node_exporter textfile collector 可读取的 Prometheus 文本"""
+        summary = summary or self.summary()
+        lines = [
+            "# HELP leaflow_phase_duration_seconds Duration of each check-in phase.",
+            "# TYPE leaflow_phase_duration_seconds summary"
+        ]
+        for phase, stats in sorted(summary.items()):
+            label = phase.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'leaflow_phase_duration_seconds{{phase="{label}",quantile="0.5"}} {stats["p50"] / 1000:.3f}')
+            lines.append(f'leaflow_phase_duration_seconds{{phase="{label}",quantile="0.95"}} {stats["p95"] / 1000:.3f}')
+            lines.append(f'leaflow_phase_duration_seconds_sum{{phase="{label}"}} {stats["sum"] / 1000:.3f}')
+            lines.append(f'leaflow_phase_duration_seconds_count{{phase="{label}"}} {stats["count"]}')
+        lines += [
+            "# HELP leaflow_phase_failures_total Check-in phases that raised or returned a failure.",
+            "# TYPE leaflow_phase_failures_total counter"
+        ]
+        for phase, stats in sorted(summary.items()):
+            label = phase.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'leaflow_phase_failures_total{{phase="{label}"}} {stats["failures"]}')
+        lines.append(f"leaflow_last_run_timestamp_seconds {time.time():.0f}")
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, path)
+            logger.info(f"Prometheus 指标已写入 {path}")
+        except OSError as e:
+            logger.warning(f"写入 Prometheus 指标失败: {e}")
+
+metrics = RunMetrics()
+
+def phase_succeeded(value):
+    """按返回值判断阶段是否成功：False、首项为 False 的 (成功, 结果, 余额) 元组和未知余额都算失败"""
+    if value is False or value == "未知":
+        return False
+    return not (isinstance(value, tuple) and value and value[0] is False)
+
+def timed(phase):
+    """方法装饰器：以实例的 account_id 为标签记录耗时，方法捕获异常后返回失败值时同样记为失败"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with metrics.span(phase, getattr(self, 'account_id', None)) as record:
+                value = func(self, *args, **kwargs)
+                record['ok'] = phase_succeeded(value)
+                return value
+        return wrapper
+    return decorator
+
+# 各步骤的候选选择器（// 开头的为 XPath），同步和 asyncio 两种模式共用
+EMAIL_SELECTORS = [
+    "input[type='text']",
+    "input[type='email']",
+    "input[placeholder*='邮箱']",
+    "input[placeholder*='邮件']",
+    "input[placeholder*='email']",
+    "input[name='email']",
+    "input[name='username']"
+]
+PASSWORD_SELECTOR = "input[type='password']"
+LOGIN_BUTTON_SELECTORS = [
+    "//button[contains(text(), '登录')]",
+    "//button[contains(text(), 'Login')]",
+    "//button[@type='submit']",
+    "//input[@type='submit']",
+    "button[type='submit']"
+]
+LOGIN_ERROR_SELECTORS = [".error", ".alert-danger", "[class*='error']", "[class*='danger']"]
+CHECKIN_INDICATORS = [
+    "button.checkin-btn",  # 优先使用这个选择器
+    "//button[contains(text(), '立即签到')]",
+    "//button[contains(text(), '已签到')]",
+    "//*[contains(text(), '每日签到')]",
+    "//*[contains(text(), '签到')]"
+]
+CHECKIN_BUTTON_SELECTORS = [
+    "button.checkin-btn",
+    "//button[contains(text(), '立即签到')]",
+    "//button[contains(@class, 'checkin')]",
+    "button[type='submit']",
+    "button[name='checkin']"
+]
+CHECKIN_RESULT_SELECTORS = [
+    ".alert-success",
+    ".success",
+    ".message",
+    "[class*='success']",
+    "[class*='message']",
+    ".modal-content",  # 弹窗内容
+    ".ant-message",    # Ant Design 消息
+    ".el-message",     # Element UI 消息
+    ".toast",          # Toast消息
+    ".notification"    # 通知
+]
+BALANCE_SELECTORS = [
+    "//*[contains(text(), '¥') or contains(text(), '￥') or contains(text(), '元')]",
+    "//*[contains(@class, 'balance')]",
+    "//*[contains(@class, 'money')]",
+    "//*[contains(@class, 'amount')]",
+    "//button[contains(@class, 'dollar')]",
+    "//span[contains(@class, 'font-medium')]"
+]
+
+def is_login_url(url):
+    """登录完成的判断条件：进入仪表板/工作空间或离开登录页"""
+    return "dashboard" in url or "workspaces" in url or "login" not in url
+
+# 签到结果页面中常见的关键词
+RESULT_KEYWORDS = ["成功", "签到", "获得", "恭喜", "谢谢", "感谢", "完成", "已签到", "连续签到"]
+
+def parse_balance(text):
+    """从包含货币符号的文本中提取余额数字"""
+    if any(char.isdigit() for char in text) and ('¥' in text or '￥' in text or '元' in text):
+        numbers = re.findall(r'\d+\.?\d*', text)
+        if numbers:
+            return numbers[0]
+    return None
+
+def extract_result_line(page_text):
+    """提取页面文本中包含结果关键词的较短一行"""
+    for keyword in RESULT_KEYWORDS:
+        if keyword in page_text:
+            for line in page_text.split('\n'):
+                if keyword in line and len(line.strip()) < 100:  # 避免提取过长的文本
+                    return line.strip()
+    return None
+
+# 明确表示签到成功或今日已签到的关键词；页面标题“每日签到”等不算结果
+CHECKIN_SUCCESS_KEYWORDS = ("签到成功", "已签到", "获得", "恭喜", "连续签到")
+CHECKIN_FAILURE_KEYWORDS = ("失败", "错误", "出错", "异常", "未找到", "稍后")
+
+def is_confirmed_result(message):
+    """结果消息明确表示签到成功或今日已签到"""
+    if not message:
+        return False
+    return (any(keyword in message for keyword in CHECKIN_SUCCESS_KEYWORDS)
+            and not any(keyword in message for keyword in CHECKIN_FAILURE_KEYWORDS))
+
+def confirmed_result_line(page_text):
+    """按关键词顺序提取页面文本中明确表示签到成功或已签到的一行，找不到时返回None"""
+    lines = [line.strip() for line in page_text.split('\n') if len(line.strip()) < 100]
+    for keyword in CHECKIN_SUCCESS_KEYWORDS:
+        for line in lines:
+            if keyword in line and is_confirmed_result(line):
+                return line
+    return None
+
+def json_checkin_message(message):
+    """签到接口成功响应中的消息；消息表示失败时返回None，没有成功字样时加上前缀，记为已确认的结果"""
+    message = str(message).strip()
+    if not message or any(keyword in message for keyword in CHECKIN_FAILURE_KEYWORDS):
+        return None
+    return message if is_confirmed_result(message) else f"签到成功: {message}"
+
+# 页面内脚本共用的查询函数：支持 CSS 和 // 开头的 XPath
+DOM_HELPERS_JS = """
+    function query(selector, limit) {
+        if (selector.indexOf('//') === 0 || selector.indexOf('(//') === 0) {
+            var snapshot = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            var nodes = [];
+            for (var i = 0; i < snapshot.snapshotLength && i < limit; i++) nodes.push(snapshot.snapshotItem(i));
+            return nodes;
+        }
+        return Array.prototype.slice.call(document.querySelectorAll(selector), 0, limit);
+    }
+    function isVisible(el) {
+        var rect = el.getBoundingClientRect(), style = window.getComputedStyle(el);
+        return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+    }
+"""
+
+# 一次 execute_script 探测所有候选选择器，返回每个匹配元素的文本、可见性和状态
+DOM_PROBE_SCRIPT = DOM_HELPERS_JS + """
+    var selectors = arguments[0], includeBody = arguments[1], limit = arguments[2];
+    var results = {};
+    selectors.forEach(function(selector) {
+        try {
+            results[selector] = query(selector, limit).map(function(el) {
+                var visible = isVisible(el);
+                return {
+                    text: visible ? (el.innerText || '').trim() : '',
+                    visible: visible,
+                    className: el.getAttribute('class') || '',
+                    enabled: !el.disabled
+                };
+            });
+        } catch (e) {
+            results[selector] = [];
+        }
+    });
+    return {matches: results, bodyText: includeBody && document.body ? document.body.innerText : ''};
+"""
+
+# 在第一个可见、可用的候选输入框中填入内容，并触发前端框架监听的 input/change 事件
+FILL_FIRST_SCRIPT = DOM_HELPERS_JS + """
+    var selectors = arguments[0], value = arguments[1];
+    for (var i = 0; i < selectors.length; i++) {
+        var nodes = [];
+        try { nodes = query(selectors[i], 20); } catch (e) {}
+        for (var j = 0; j < nodes.length; j++) {
+            var el = nodes[j];
+            if (!isVisible(el) || el.disabled) continue;
+            el.focus();
+            var setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+            setter.call(el, value);
+            el.dispatchEvent(new Event('input', {bubbles: true}));
+            el.dispatchEvent(new Event('change', {bubbles: true}));
+            return selectors[i];
+        }
+    }
+    return null;
+"""
+
+# 找到第一个可见的候选元素，返回其状态；click 为真且元素可用时点击
+CLICK_FIRST_SCRIPT = DOM_HELPERS_JS + """
+    var selectors = arguments[0], click = arguments[1], skipText = arguments[2];
+    for (var i = 0; i < selectors.length; i++) {
+        var nodes = [];
+        try { nodes = query(selectors[i], 20); } catch (e) {}
+        for (var j = 0; j < nodes.length; j++) {
+            var el = nodes[j];
+            if (!isVisible(el)) continue;
+            var text = (el.innerText || el.value || '').trim();
+            var enabled = !el.disabled;
+            var clicked = false;
+            if (click && enabled && !(skipText && text.indexOf(skipText) !== -1)) {
+                el.click();
+                clicked = true;
+            }
+            return {selector: selectors[i], text: text, enabled: enabled, clicked: clicked};
+        }
+    }
+    return null;
+"""
+
+# 按顺序返回第一个可见的候选元素及命中的选择器；enabledOnly 为真时跳过禁用的元素
+LOCATE_FIRST_SCRIPT = DOM_HELPERS_JS + """
+    var selectors = arguments[0], enabledOnly = arguments[1];
+    for (var i = 0; i < selectors.length; i++) {
+        var nodes = [];
+        try { nodes = query(selectors[i], 20); } catch (e) {}
+        for (var j = 0; j < nodes.length; j++) {
+            var el = nodes[j];
+            if (!isVisible(el) || (enabledOnly && el.disabled)) continue;
+            return {selector: selectors[i], element: el};
+        }
+    }
+    return null;
+"""
+
+def balance_from_probe(probe, selectors):
+    """从批量探测结果中按选择器顺序取第一个余额，返回 (余额, 命中的选择器)"""
+    for selector in selectors:
+        for element in probe['matches'].get(selector, []):
+            # 查找包含数字和货币符号的文本
+            balance = parse_balance(element['text'])
+            if balance:
+                return balance, selector
+    return None, None
+
+def result_from_probe(probe):
+    """从批量探测结果中解析签到结果消息"""
+    for selector in CHECKIN_RESULT_SELECTORS:
+        for element in probe['matches'].get(selector, []):
+            if element['visible'] and element['text']:
+                return element['text']
+    
+    # 如果没有找到特定元素，检查页面文本中明确的成功消息
+    result_line = confirmed_result_line(probe['bodyText'])
+    if result_line:
+        return result_line
+    
+    # 检查签到按钮状态变化
+    for checkin_btn in probe['matches'].get("button.checkin-btn", []):
+        if not checkin_btn['enabled'] or "已签到" in checkin_btn['text'] or "disabled" in checkin_btn['className']:
+            return "今日已签到完成"
+    
+    # 其他含结果关键词的行（如“每日签到”标题）只用于展示，不算确认的结果
+    return extract_result_line(probe['bodyText']) or "签到完成，但未找到具体结果消息"
+
+def html_to_text(markup):
+    """去除标签和脚本，把HTML转换为按行分隔的纯文本"""
+    markup = re.sub(r'(?is)<(script|style)[^>]*>.*?</\1>', '', markup)
+    markup = re.sub(r'(?i)<br\s*/?>|</(p|div|li|h\d|tr|button|span)>', '\n', markup)
+    text = html.unescape(re.sub(r'<[^>]+>', '', markup))
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+# 签到接口和用户信息接口返回的 JSON 中可能使用的字段名
+JSON_MESSAGE_KEYS = ('message', 'msg', 'detail')
+JSON_BALANCE_KEYS = ('balance', 'total_balance', 'user_balance', 'money')
+
+# 签到页的表单提交到签到页本身；前端接口一般为 /api/checkin、/api/user 等
+CHECKIN_API_PATH = re.compile(r'^/(api/(v\d+/)?)?check-?in/?$', re.I)
+BALANCE_API_PATH = re.compile(r'^/(api/(v\d+/)?)?(user|users/me|me|profile|account|wallet|balance)(/balance)?/?$', re.I)
+
+# 表示请求失败的 status 字段取值
+JSON_FAILURE_STATUSES = ('error', 'fail', 'failed', 'failure')
+
+def network_capture_enabled():
+    return os.getenv('LEAFLOW_NETWORK_CAPTURE', '1').strip() != '0'
+
+def profiling_enabled():
+    return os.getenv('LEAFLOW_PROFILE', '0').strip() == '1'
+
+def trace_enabled():
+    return profiling_enabled() and os.getenv('LEAFLOW_PROFILE_TRACE', '0').strip() == '1'
+
+# 完整 trace 记录的类别，足以区分网络、脚本执行和渲染
+TRACE_CATEGORIES = ",".join([
+    'devtools.timeline', 'disabled-by-default-devtools.timeline', 'blink.user_timing',
+    'loading', 'navigation', 'v8.execute', 'netlog'
+])
+
+class PageProfiler:
+    """页面性能剖析 - 采集 Performance.getMetrics、导航/资源计时和可选的 Chrome trace，
+    只保存加载时间超过阈值的页面，gzip 压缩后放入有数量上限的目录，最旧的文件先删除"""
+    
+    # 导航计时和耗时最长的资源
+    _SCRIPT = """
+        var nav = performance.getEntriesByType('navigation')[0];
+        var resources = performance.getEntriesByType('resource').map(function(r) {
+            return {name: r.name, type: r.initiatorType, start: r.startTime, duration: r.duration,
+                    transferSize: r.transferSize || 0};
+        });
+        resources.sort(function(a, b) { return b.duration - a.duration; });
+        return {navigation: nav ? nav.toJSON() : null, resources: resources.slice(0, 30)};
+    """
+    
+    def __init__(self, directory, threshold_ms=3000, keep=20):
+        self.directory = directory
+        self.threshold_ms = threshold_ms
+        self.keep = keep
+        self.saved = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+    
+    @classmethod
+    def from_env(cls):
+        """LEAFLOW_PROFILE=1 时启用"""
+        if not profiling_enabled():
+            return None
+        return cls(os.path.join(get_state_dir(), 'profiles'),
+                   get_int_env('LEAFLOW_PROFILE_THRESHOLD_MS', 3000),
+                   get_int_env('LEAFLOW_PROFILE_KEEP', 20))
+    
+    def capture(self, driver, page, account_id, trace_events=None):
+        """读取当前页面的性能数据，加载时间超过阈值时保存，返回保存的路径"""
+        try:
+            timing = driver.execute_script(self._SCRIPT) or {}
+            result = driver.execute_cdp_cmd('Performance.getMetrics', {})
+        except Exception as e:
+            logger.debug(f"读取页面性能数据失败: {e}")
+            return None
+        
+        navigation = timing.get('navigation') or {}
+        load_ms = navigation.get('duration') or 0
+        if load_ms < self.threshold_ms:
+            return None
+        
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'page': page,
+            'url': navigation.get('name'),
+            'account': account_id,
+            'load_ms': round(load_ms, 1),
+            'metrics': {item['name']: item['value'] for item in result.get('metrics', [])},
+            'navigation': navigation,
+            'resources': timing.get('resources', []),
+            'traceEvents': trace_events or []
+        }
+        return self.save(record)
+    
+    def save(self, record):
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{record['page']}-{record['account']}.json.gz"
+        path = os.path.join(self.directory, name)
+        try:
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"保存页面性能数据失败: {e}")
+            return None
+        logger.info(f"{record['page']} 页面加载 {record['load_ms']:.0f}ms，超过阈值，性能数据已保存到 {path}")
+        with self._lock:
+            self.saved += 1
+            self.prune()
+        return path
+    
+    def prune(self):
+        """只保留最新的 keep 个文件"""
+        try:
+            files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.json.gz')]
+            files.sort(key=os.path.getmtime)
+            for path in files[:-self.keep]:
+                os.remove(path)
+        except OSError as e:
+            logger.debug(f"清理性能数据目录失败: {e}")
+
+def find_json_value(data, keys, depth=0):
+    """在嵌套的 JSON 中按广度优先查找第一个非空的标量字段"""
+    if depth > 5:
+        return None
+    if isinstance(data, dict):
+        for key in keys:
+            value = data.get(key)
+            if isinstance(value, (str, int, float)) and not isinstance(value, bool) and str(value).strip():
+                return value
+        children = list(data.values())
+    elif isinstance(data, list):
+        children = data
+    else:
+        return None
+    for child in children:
+        value = find_json_value(child, keys, depth + 1)
+        if value is not None:
+            return value
+    return None
+
+def json_reports_failure(data):
+    """接口响应的 success/code/status/error 字段表示请求失败"""
+    if not isinstance(data, dict):
+        return False
+    if data.get('success') is False or data.get('ok') is False:
+        return True
+    if data.get('error') or data.get('errors'):
+        return True
+    code = data.get('code')
+    if code is not None and str(code).strip() not in ('0', '200', 'ok', 'OK', 'success'):
+        return True
+    return str(data.get('status', '')).strip().lower() in JSON_FAILURE_STATUSES
+
+def balance_from_json(data):
+    """从接口响应中取余额数字"""
+    value = find_json_value(data, JSON_BALANCE_KEYS)
+    if value is None:
+        return None
+    numbers = re.findall(r'\d+\.?\d*', str(value))
+    return numbers[0] if numbers else None
+
+class NetworkCapture:
+    """网络响应捕获 - 根据 CDP Network 事件记录站点返回的 JSON 响应，读取签到结果和余额"""
+    
+    MAX_RESPONSES = 50
+    
+    def __init__(self):
+        self._requests = {}
+        self._finished = []
+        self.responses = []
+    
+    def handle(self, method, params):
+        """处理一条 Network 事件"""
+        request_id = params.get('requestId')
+        if method == 'Network.requestWillBeSent':
+            request = params.get('request', {})
+            self._requests[request_id] = {'method': request.get('method', 'GET'), 'url': request.get('url', '')}
+        elif method == 'Network.responseReceived':
+            response = params.get('response', {})
+            request = self._requests.get(request_id)
+            if request is None:
+                request = self._requests[request_id] = {'method': 'GET', 'url': response.get('url', '')}
+            request['status'] = response.get('status', 0)
+            request['json'] = 'json' in (response.get('mimeType') or '') and self.is_site_url(request['url'])
+        elif method == 'Network.loadingFinished':
+            request = self._requests.pop(request_id, None)
+            if request and request.get('json'):
+                self._finished.append((request_id, request))
+        elif method == 'Network.loadingFailed':
+            self._requests.pop(request_id, None)
+    
+    @staticmethod
+    def is_site_url(url):
+        return any(url.startswith(origin) for origin in LEAFLOW_ORIGINS)
+    
+    @staticmethod
+    def is_checkin_endpoint(url):
+        """签到页本身（表单提交）或签到接口"""
+        parts, checkin = urlsplit(url), urlsplit(LEAFLOW_CHECKIN_URL)
+        if (parts.netloc, parts.path.rstrip('/')) == (checkin.netloc, checkin.path.rstrip('/')):
+            return True
+        return bool(CHECKIN_API_PATH.match(parts.path))
+    
+    def take_finished(self):
+        """取出已加载完成、还未读取内容的 JSON 响应"""
+        finished, self._finished = self._finished, []
+        return finished
+    
+    def add_body(self, request, body, base64_encoded=False):
+        try:
+            if base64_encoded:
+                body = base64.b64decode(body).decode('utf-8')
+            data = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            return
+        self.responses.append((request['method'], request['url'], request.get('status', 0), data))
+        del self.responses[:-self.MAX_RESPONSES]
+    
+    def checkin_result(self):
+        """最近一次成功的签到提交返回的消息；查询状态的 GET 请求和失败的响应不算签到结果，
+        交给页面文本判断"""
+        for method, url, status, data in reversed(self.responses):
+            if method == 'GET' or not self.is_checkin_endpoint(url):
+                continue
+            if status >= 400 or json_reports_failure(data):
+                logger.info(f"签到接口返回失败: {urlsplit(url).path} ({status})")
+                return None
+            message = find_json_value(data, JSON_MESSAGE_KEYS)
+            if message is not None:
+                logger.info(f"从接口响应读取签到结果: {urlsplit(url).path}")
+                return json_checkin_message(message)
+        return None
+    
+    def balance(self):
+        """最近一次用户/余额接口响应中的余额，其他接口（如签到奖励金额）不读取"""
+        for _, url, status, data in reversed(self.responses):
+            if status >= 400 or not BALANCE_API_PATH.match(urlsplit(url).path) or json_reports_failure(data):
+                continue
+            balance = balance_from_json(data)
+            if balance:
+                logger.info(f"从接口响应读取余额: {urlsplit(url).path}")
+                return balance
+        return None
+
+def drain_performance_log(driver):
+    """取出 Chrome 性能日志中的 DevTools 事件，返回 (method, params) 列表"""
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        logger.debug(f"读取性能日志失败: {e}")
+        return []
+    events = []
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+            events.append((message['method'], message.get('params', {})))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return events
+
+class DriverPool:
+    """浏览器实例池 - 复用Chrome进程，每个账号分配前清空上下文"""
+    
+    def __init__(self, size, max_uses=20):
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._closed = False
+    
+    def acquire(self):
+        """取出一个可用的浏览器实例，没有空闲实例时新建"""
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if self.is_healthy(driver):
+                    logger.info("复用已有浏览器实例")
+                    return driver
+                logger.warning("浏览器实例已失效，重新创建")
+                self._discard(driver)
+            
+            driver = create_chrome_driver()
+            with self._lock:
+                self._uses[driver.session_id] = 0
+            return driver
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def release(self, driver):
+        """归还浏览器实例，达到复用上限或状态异常时回收"""
+        try:
+            with self._lock:
+                uses = self._uses.get(driver.session_id, 0) + 1
+                self._uses[driver.session_id] = uses
+            
+            if self._closed or uses >= self.max_uses:
+                logger.info(f"浏览器实例已使用 {uses} 次，回收")
+                self._discard(driver)
+            elif not self.reset(driver):
+                logger.warning("清理浏览器上下文失败，回收实例")
+                self._discard(driver)
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+    
+    def is_healthy(self, driver):
+        """检查浏览器实例是否仍可响应"""
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+    
+    def reset(self, driver):
+        """清空Cookie、存储和缓存，关闭多余窗口"""
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.get("about:blank")
+            
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            for origin in LEAFLOW_ORIGINS:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                    "origin": origin,
+                    "storageTypes": "all"
+                })
+            return True
+        except Exception as e:
+            logger.debug(f"重置浏览器上下文出错: {e}")
+            return False
+    
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(driver.session_id, None)
+        try:
+            quit_driver(driver)
+        except Exception:
+            pass
+    
+    def trim(self, keep):
+        """关闭多余的空闲浏览器实例，只保留 keep 个"""
+        while self._idle.qsize() > keep:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+    
+    def close(self):
+        """关闭池中所有空闲的浏览器实例"""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+def child_pids(pid):
+    """递归查找子进程，没有 psutil 时读取 /proc"""
+    if psutil:
+        try:
+            return [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+    
+    parents = {}
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                # comm 字段可能包含空格和括号，从最后一个 ) 之后开始解析
+                fields = f.read().rsplit(b')', 1)[1].split()
+            parents.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    
+    found = []
+    stack = [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+def kill_process_tree(pid):
+    """先杀子进程（Chrome）再杀父进程（chromedriver），返回杀掉的进程数"""
+    killed = 0
+    for target in child_pids(pid)[::-1] + [pid]:
+        try:
+            os.kill(target, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
+
+def driver_pid(driver):
+    """chromedriver 进程号，Chrome 是它的子进程"""
+    try:
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
+class WatchdogEntry:
+    """一个账号的硬性期限，期限内登记的浏览器进程会在超时后被杀掉"""
+    
+    def __init__(self, deadline, label):
+        self.deadline = deadline
+        self.label = label
+        self.pids = []
+        self.expired = False
+        self._lock = threading.Lock()
+    
+    def attach(self, pid):
+        with self._lock:
+            if pid in self.pids:
+                return
+            self.pids.append(pid)
+            expired = self.expired
+        if expired:
+            kill_process_tree(pid)
+    
+    def expire(self):
+        with self._lock:
+            self.expired = True
+            pids = list(self.pids)
+        killed = sum(kill_process_tree(pid) for pid in pids)
+        logger.error(f"账号 {self.label} 超过硬性期限，已结束 {killed} 个浏览器进程")
+
+class Watchdog:
+    """账号看门狗 - 后台线程按期限检查，超时后杀掉该账号的浏览器进程树，让阻塞的驱动调用立即失败"""
+    
+    def __init__(self):
+        self._entries = set()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._thread = None
+    
+    @contextlib.contextmanager
+    def guard(self, budget, label):
+        """在当前线程登记一个期限为 budget 秒的账号"""
+        entry = WatchdogEntry(time.monotonic() + budget, label)
+        with self._cond:
+            self._entries.add(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='watchdog', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        self._local.entry = entry
+        try:
+            yield entry
+        finally:
+            self._local.entry = None
+            with self._cond:
+                self._entries.discard(entry)
+    
+    def attach(self, driver):
+        """把浏览器实例登记到当前线程的账号上"""
+        self.attach_pid(driver_pid(driver))
+    
+    def attach_pid(self, pid):
+        """把进程（chromedriver，Chrome 是它的子进程）登记到当前线程的账号上"""
+        entry = getattr(self._local, 'entry', None)
+        if entry and pid:
+            entry.attach(pid)
+    
+    @contextlib.contextmanager
+    def paused(self):
+        """暂停当前线程账号的期限，排队等待资源的时间不计入"""
+        entry = getattr(self._local, 'entry', None)
+        if entry is None:
+            yield
+            return
+        with self._cond:
+            remaining = entry.deadline - time.monotonic()
+            entry.deadline = float('inf')
+        try:
+            yield
+        finally:
+            with self._cond:
+                entry.deadline = time.monotonic() + remaining
+                self._cond.notify()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                expired = [entry for entry in self._entries if entry.deadline <= now]
+                for entry in expired:
+                    self._entries.discard(entry)
+                if not expired:
+                    next_deadline = min((entry.deadline for entry in self._entries), default=now + 60)
+                    self._cond.wait(min(next_deadline - now, 60))
+                    continue
+            for entry in expired:
+                entry.expire()
+
+watchdog = Watchdog()
+
+def process_tree_rss_mb(pid):
+    """进程及其所有子进程的常驻内存之和（MB）"""
+    total = 0
+    page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+    for target in [pid] + child_pids(pid):
+        try:
+            if psutil:
+                total += psutil.Process(target).memory_info().rss
+            else:
+                with open(f'/proc/{target}/statm') as f:
+                    total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError) + ((psutil.Error,) if psutil else ()):
+            continue
+    return total / 1024 / 1024
+
+def available_memory_mb():
+    """系统可用内存（MB），无法获取时返回 None"""
+    if psutil:
+        return psutil.virtual_memory().available / 1024 / 1024
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+class MemorySession:
+    """一个浏览器会话的内存采样"""
+    
+    def __init__(self, label):
+        self.label = label
+        self.pid = None
+        self.current = 0.0
+        self.peak = 0.0
+        self.total = 0.0
+        self.samples = 0
+    
+    def sample(self):
+        if not self.pid:
+            return
+        self.current = process_tree_rss_mb(self.pid)
+        if self.current:
+            self.peak = max(self.peak, self.current)
+            self.total += self.current
+            self.samples += 1
+
+class MemoryGovernor:
+    """内存感知的并发控制 - 采样每个浏览器进程树的 RSS，按可用内存和预算调整同时运行的浏览器会话数"""
+    
+    # 还没有实测数据时，按每个浏览器会话占用的内存估算
+    DEFAULT_SESSION_MB = 350
+    SAMPLE_INTERVAL = 0.5
+    # 只使用可用内存的这一比例，给系统和其他进程留余量
+    HEADROOM = 0.9
+    
+    def __init__(self, max_sessions, budget_mb=0, on_shrink=None):
+        self.max_sessions = max(1, max_sessions)
+        self.budget_mb = budget_mb
+        self.on_shrink = on_shrink
+        self.limit = self.max_sessions
+        self.limit_range = [self.limit, self.limit]
+        self.finished = []
+        self._active = set()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._thread = None
+    
+    @classmethod
+    def from_env(cls, max_sessions, on_shrink=None):
+        """LEAFLOW_MEMORY_BUDGET_MB 为浏览器会话可用的内存上限，未设置时只按系统可用内存调整"""
+        return cls(max_sessions, get_int_env('LEAFLOW_MEMORY_BUDGET_MB', 0), on_shrink)
+    
+    @contextlib.contextmanager
+    def session(self, label):
+        """占用一个浏览器会话名额，超出当前上限时排队等待"""
+        record = MemorySession(label)
+        with watchdog.paused(), self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='memory', daemon=True)
+                self._thread.start()
+            while len(self._active) >= self.limit:
+                self._cond.wait()
+            self._active.add(record)
+        self._local.session = record
+        try:
+            yield record
+        finally:
+            self._local.session = None
+            with self._cond:
+                self._active.discard(record)
+                if record.samples:
+                    self.finished.append(record)
+                self._cond.notify_all()
+    
+    def attach(self, driver):
+        """登记当前线程会话使用的浏览器进程"""
+        record = getattr(self._local, 'session', None)
+        if record:
+            record.pid = driver_pid(driver)
+            record.sample()
+    
+    def session_estimate(self):
+        """单个会话的内存估算：已观察到的最大峰值"""
+        peaks = [record.peak for record in list(self._active) + self.finished if record.peak]
+        return max(peaks) if peaks else self.DEFAULT_SESSION_MB
+    
+    def _recompute(self):
+        with self._cond:
+            active = list(self._active)
+        for record in active:
+            record.sample()
+        
+        used = sum(record.current for record in active)
+        capacities = []
+        available = available_memory_mb()
+        if available is not None:
+            capacities.append(used + available * self.HEADROOM)
+        if self.budget_mb:
+            capacities.append(self.budget_mb)
+        if not capacities:
+            return
+        
+        limit = int(min(capacities) // self.session_estimate())
+        limit = min(max(limit, 1), self.max_sessions)
+        with self._cond:
+            previous = self.limit
+            if limit == previous:
+                return
+            self.limit = limit
+            self.limit_range = [min(self.limit_range[0], limit), max(self.limit_range[1], limit)]
+            self._cond.notify_all()
+        logger.info(f"按内存调整浏览器并发: {previous} -> {limit}（单会话约 {self.session_estimate():.0f}MB）")
+        if limit < previous and self.on_shrink:
+            self.on_shrink(limit)
+    
+    def _run(self):
+        while True:
+            time.sleep(self.SAMPLE_INTERVAL)
+            try:
+                self._recompute()
+            except Exception as e:
+                logger.debug(f"内存采样出错: {e}")
+    
+    def report(self):
+        """输出每个账号浏览器进程树的峰值和平均内存"""
+        with self._cond:
+            records = list(self.finished)
+        if not records:
+            return
+        peaks = sorted(record.peak for record in records)
+        averages = [record.total / record.samples for record in records]
+        logger.info(
+            f"浏览器内存: {len(records)} 个会话，单账号峰值 平均 {sum(peaks) / len(peaks):.0f}MB / "
+            f"p95 {RunMetrics.percentile(peaks, 95):.0f}MB / 最大 {peaks[-1]:.0f}MB，"
+            f"单账号平均 {sum(averages) / len(averages):.0f}MB，"
+            f"并发上限 {self.limit_range[0]}-{self.limit_range[1]}"
+        )
+
+class SessionCache:
+    """登录状态缓存 - 按账号加密保存Cookie和本地存储，超过TTL自动失效"""
+    
+    # Network.setCookies 接受的字段
+    COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+    
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+    
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建缓存，未启用或缺少依赖时返回None"""
+        if os.getenv('LEAFLOW_SESSION_CACHE', '1').strip() == '0':
+            return None
+        if Fernet is None:
+            logger.warning("未安装 cryptography，登录状态缓存已禁用")
+            return None
+        ttl = get_int_env('LEAFLOW_SESSION_TTL', 3 * 24 * 3600)
+        return cls(os.path.join(get_state_dir(), 'sessions'), ttl)
+    
+    def _path(self, email):
+        return os.path.join(self.directory, f"{account_hash(email)}.session")
+    
+    def _fernet(self, email, password):
+        # 未配置独立密钥时由账号密码派生，缓存文件离开密码无法解密
+        secret = os.getenv('LEAFLOW_SESSION_KEY') or password
+        key = hashlib.pbkdf2_hmac('sha256', secret.encode('utf-8'), account_hash(email).encode('utf-8'), 200000)
+        return Fernet(base64.urlsafe_b64encode(key))
+    
+    def load(self, email, password):
+        """读取并解密登录状态，不存在或已过期时返回None"""
+        path = self._path(email)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                token = f.read()
+            data = self._fernet(email, password).decrypt(token, ttl=self.ttl)
+            return json.loads(data.decode('utf-8'))
+        except (InvalidToken, ValueError, OSError) as e:
+            logger.info(f"登录状态缓存不可用: {type(e).__name__}")
+            self.delete(email)
+            return None
+    
+    def save(self, email, password, state):
+        """加密保存登录状态"""
+        path = self._path(email)
+        token = self._fernet(email, password).encrypt(json.dumps(state).encode('utf-8'))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(token)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+    
+    def delete(self, email):
+        try:
+            os.remove(self._path(email))
+        except OSError:
+            pass
+    
+    @classmethod
+    def cookie_params(cls, cookies):
+        """将CDP返回的Cookie转换为可写回浏览器的参数"""
+        params = []
+        for cookie in cookies:
+            param = {key: cookie[key] for key in cls.COOKIE_FIELDS if key in cookie}
+            if cookie.get('session') or param.get('expires', -1) < 0:
+                param.pop('expires', None)
+            params.append(param)
+        return params
+    
+    @staticmethod
+    def storage_script(local_storage):
+        """页面加载前写入本地存储的脚本，只作用于主站"""
+        return (
+            "(function(items){"
+            f"if (location.hostname !== {json.dumps(LEAFLOW_HOSTNAME)}) return;"
+            "for (var k in items) { if (localStorage.getItem(k) === null) localStorage.setItem(k, items[k]); }"
+            f"}})({json.dumps(local_storage)});"
+        )
+    
+    @staticmethod
+    def cookies_from_jar(jar):
+        """把 requests 的 CookieJar 转换为与 CDP Network.getAllCookies 相同的格式"""
+        return [{
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'secure': cookie.secure,
+            'httpOnly': cookie.has_nonstandard_attr('HttpOnly'),
+            'expires': cookie.expires if cookie.expires is not None else -1,
+            'session': cookie.expires is None
+        } for cookie in jar]
+
+class TokenBucket:
+    """令牌桶限速 - 所有工作线程和协程共享，限制登录和签到请求的总频率"""
+    
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls):
+        """LEAFLOW_RATE_LIMIT 为每分钟允许的操作数，设为 0 不限速"""
+        try:
+            rate = float(os.getenv('LEAFLOW_RATE_LIMIT', '60'))
+        except ValueError:
+            rate = 60.0
+        return cls(rate, get_int_env('LEAFLOW_RATE_BURST', 10)) if rate > 0 else None
+    
+    def _reserve(self):
+        """预占一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+    
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+rate_limiter = TokenBucket.from_env()
+
+def throttle():
+    """登录和签到前调用，受全局令牌桶限制"""
+    if rate_limiter:
+        rate_limiter.acquire()
+
+async def throttle_async():
+    if rate_limiter:
+        await rate_limiter.acquire_async()
+
+class CheckinStateStore:
+    """每日签到记录 - 按账号哈希和日期保存结果，重复运行时跳过当天已签到的账号"""
+    
+    def __init__(self, path, tz_name='Asia/Shanghai', keep_days=7):
+        self.path = path
+        self.keep_days = keep_days
+        try:
+            self.tz = ZoneInfo(tz_name)
+        except ZoneInfoNotFoundError:
+            logger.warning(f"未知时区 {tz_name}，使用 UTC+8")
+            self.tz = timezone(timedelta(hours=8))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkins ("
+                "account TEXT NOT NULL, day TEXT NOT NULL, result TEXT, balance TEXT, updated_at REAL, "
+                "PRIMARY KEY (account, day))"
+            )
+    
+    @classmethod
+    def from_env(cls):
+        """LEAFLOW_SKIP_CHECKED_IN=0 时不启用"""
+        if os.getenv('LEAFLOW_SKIP_CHECKED_IN', '1').strip() == '0':
+            return None
+        return cls(os.path.join(get_state_dir(), 'checkins.db'), os.getenv('LEAFLOW_TIMEZONE', 'Asia/Shanghai'))
+    
+    def today(self):
+        """签到日期按站点所在时区计算"""
+        return datetime.now(self.tz).date().isoformat()
+    
+    def get(self, email):
+        """返回当天已保存的 (结果, 余额)，没有记录时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, balance FROM checkins WHERE account = ? AND day = ?",
+                (account_hash(email), self.today())
+            ).fetchone()
+        return row
+    
+    def record(self, email, result, balance):
+        """保存当天的签到结果，并清理过期记录"""
+        today = self.today()
+        oldest = (datetime.now(self.tz).date() - timedelta(days=self.keep_days)).isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkins (account, day, result, balance, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (account_hash(email), today, result, balance, time.time())
+            )
+            self._conn.execute("DELETE FROM checkins WHERE day < ?", (oldest,))
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class WorkQueue:
+    """sqlite 工作队列 - 生产者写入账号，多个 worker 进程租用账号并写回结果，租约过期的账号会被重新领取
+    
+    队列里只保存账号哈希，worker 按自己加载的账号配置找到对应的邮箱和密码；
+    多台机器共享同一个数据库文件时即可分布式处理。
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY, account TEXT NOT NULL UNIQUE, email TEXT, priority INTEGER DEFAULT 0, "
+                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER DEFAULT 0, available_at REAL DEFAULT 0, "
+                "lease_owner TEXT, lease_until REAL, success INTEGER, result TEXT, balance TEXT, updated_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, id)")
+    
+    @classmethod
+    def from_env(cls, path=None):
+        """默认使用状态目录中的 queue.db，可用 LEAFLOW_QUEUE_DB 指向共享存储"""
+        return cls(path or os.getenv('LEAFLOW_QUEUE_DB', '').strip() or os.path.join(get_state_dir(), 'queue.db'))
+    
+    def enqueue(self, accounts):
+        """写入账号，已存在的账号重置为待处理，返回写入数量"""
+        count = 0
+        now = time.time()
+        with self._lock, self._conn:
+            for account in accounts:
+                self._conn.execute(
+                    "INSERT INTO jobs (account, email, priority, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(account) DO UPDATE SET email = excluded.email, priority = excluded.priority, "
+                    "status = 'pending', attempts = 0, available_at = 0, lease_owner = NULL, lease_until = NULL, "
+                    "success = NULL, result = NULL, balance = NULL, updated_at = excluded.updated_at",
+                    (account_hash(account['email']), mask_email(account['email']), account.get('priority', 0), now)
+                )
+                count += 1
+        return count
+    
+    def lease(self, owner, seconds, max_attempts, exclude=()):
+        """领取一个待处理或租约已过期的账号，返回 (任务号, 账号哈希, 第几次尝试)，没有可领取的返回 None"""
+        now = time.time()
+        skip = ",".join("?" * len(exclude))
+        skip_clause = f" AND id NOT IN ({skip})" if exclude else ""
+        with self._lock, self._conn:
+            # 多次租约过期（worker 崩溃或被杀）的账号不再重试
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', success = 0, result = '多次租约过期，worker 未能完成', "
+                "balance = '未知', lease_owner = NULL, updated_at = ? "
+                "WHERE status = 'leased' AND lease_until <= ? AND attempts >= ?",
+                (now, now, max_attempts)
+            )
+            # 单条 UPDATE 在数据库写锁下完成选择和占用，多个进程不会领到同一个账号
+            self._conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_until = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = (SELECT id FROM jobs WHERE "
+                "((status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_until <= ?))"
+                f"{skip_clause} ORDER BY priority DESC, id LIMIT 1)",
+                (owner, now + seconds, now, now, now, *exclude)
+            )
+            row = self._conn.execute(
+                "SELECT id, account, attempts FROM jobs WHERE status = 'leased' AND lease_owner = ? AND updated_at = ?",
+                (owner, now)
+            ).fetchone()
+        return row
+    
+    def renew(self, job_id, owner, seconds):
+        """把仍由 owner 持有的租约延长到 seconds 秒后，租约已被他人接手时返回 False"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time() + seconds, job_id, owner)
+            ).rowcount > 0
+    
+    def release(self, job_id, owner):
+        """放弃租约，让其他 worker 领取"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = attempts - 1, lease_owner = NULL, lease_until = NULL "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (job_id, owner)
+            )
+    
+    def complete(self, job_id, owner, outcome, retry_at=None):
+        """写回结果；retry_at 不为空时重新排队，在该时间之后再领取。租约已被他人接手时忽略"""
+        _, success, result, balance = outcome
+        status = 'pending' if retry_at else 'done'
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, success = ?, result = ?, balance = ?, available_at = ?, "
+                "lease_owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (status, int(bool(success)), result, balance, retry_at or 0, time.time(), job_id, owner)
+            ).rowcount
+        if not updated:
+            logger.warning(f"任务 {job_id} 的租约已过期并被其他 worker 接手，结果未写回")
+    
+    def has_work(self, exclude=()):
+        """是否还有未完成的账号（包括其他 worker 正在处理的）"""
+        skip = ",".join("?" * len(exclude))
+        skip_clause = f" AND id NOT IN ({skip})" if exclude else ""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE status != 'done'{skip_clause}", tuple(exclude)
+            ).fetchone()
+        return row[0] > 0
+    
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    
+    def results(self):
+        """已完成账号的 (邮箱, 是否成功, 结果, 余额)，邮箱已脱敏"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT email, success, result, balance FROM jobs WHERE status = 'done' ORDER BY id"
+            ).fetchall()
+        return [(email, bool(success), result, balance) for email, success, result, balance in rows]
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class AccountIndex:
+    """worker 按账号哈希查找账号配置 - 顺序读取账号来源，内存中只保留最近读到的 window 个账号；
+    找不到时从头再读一遍，读完一整遍后记住全部账号哈希（不含密码），不属于本机的账号直接返回 None
+    """
+    
+    def __init__(self, load, window=256):
+        self.load = load
+        self.window = max(1, window)
+        self._recent = {}
+        self._keys = None
+        self._seen = set()
+        self._accounts = None
+        self._lock = threading.Lock()
+    
+    def _next(self):
+        """读取下一个账号，读完一遍时返回 None 并回到开头"""
+        if self._accounts is None:
+            self._accounts = iter(self.load())
+        try:
+            account = next(self._accounts)
+        except StopIteration:
+            self._accounts = None
+            if self._keys is None:
+                self._keys = self._seen
+            return None
+        key = account_hash(account['email'])
+        if self._keys is None:
+            self._seen.add(key)
+        self._recent.pop(key, None)
+        self._recent[key] = account
+        if len(self._recent) > self.window:
+            del self._recent[next(iter(self._recent))]
+        return key
+    
+    def get(self, key):
+        with self._lock:
+            if key in self._recent:
+                return self._recent[key]
+            if self._keys is not None and key not in self._keys:
+                return None
+            # 最多读完一整遍（当前位置到末尾，再从开头到当前位置）
+            wrapped = False
+            while True:
+                found = self._next()
+                if found == key:
+                    return self._recent[key]
+                if found is None:
+                    if wrapped or (self._keys is not None and key not in self._keys):
+                        return None
+                    wrapped = True
+
+class SelectorRegistry:
+    """选择器命中统计 - 记录每个步骤实际命中的选择器并持久化，后续运行优先尝试"""
+    
+    # 连续失败达到该次数的选择器排到最后
+    DEMOTE_AFTER = 3
+    
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = self._load()
+    
+    @classmethod
+    def from_env(cls):
+        """使用状态目录中的统计文件"""
+        return cls(os.path.join(get_state_dir(), 'selector_stats.json'))
+    
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取选择器统计失败: {e}")
+            return {}
+    
+    def order(self, step, selectors):
+        """按历史命中率排序，未记录的保持原有顺序"""
+        with self._lock:
+            stats = dict(self._stats.get(step, {}))
+        
+        def sort_key(item):
+            index, selector = item
+            record = stats.get(selector, {})
+            hits = record.get('hits', 0)
+            misses = record.get('misses', 0)
+            demoted = record.get('streak', 0) >= self.DEMOTE_AFTER
+            return demoted, -(hits + 1) / (hits + misses + 2), index
+        
+        return [selector for _, selector in sorted(enumerate(selectors), key=sort_key)]
+    
+    def record(self, step, selector, hit):
+        """记录一次命中或未命中"""
+        with self._lock:
+            record = self._stats.setdefault(step, {}).setdefault(selector, {'hits': 0, 'misses': 0, 'streak': 0})
+            if hit:
+                record['hits'] += 1
+                record['streak'] = 0
+            else:
+                record['misses'] += 1
+                record['streak'] += 1
+    
+    def record_winner(self, step, ordered, winner):
+        """记录按顺序探测的结果：winner 之前的选择器都算未命中"""
+        for selector in ordered:
+            if selector == winner:
+                self.record(step, selector, True)
+                return
+            self.record(step, selector, False)
+    
+    def save(self):
+        """写回统计文件"""
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self._stats, ensure_ascii=False, indent=2)
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"保存选择器统计失败: {e}")
+
+# 各等待步骤的固定超时，单位秒；账号设置了 timeout 时用它代替这里的值
+STEP_DEFAULTS = {
+    'login_email': 10,
+    'login_password': 10,
+    'login_button': 10,
+    'login_redirect': 20,
+    'checkin_page': 20,
+    'checkin_button': 15,
+    'checkin_settle': 10
+}
+
+class StepTimeouts:
+    """自适应超时 - 按步骤保存历史耗时，以 p99 乘以余量作为超时，样本不足或重试时使用固定值
+    
+    超时的步骤按已等待的时间记为删失样本（真实耗时至少这么长），超时时间可以随之回升，
+    最多到固定值的 MAX_GROWTH 倍；本次运行中同一步骤超时 GIVE_UP_AFTER 次后不再低于固定值。
+    """
+    
+    MAX_SAMPLES = 200
+    MIN_SAMPLES = 20
+    MARGIN = 2.0
+    FLOOR = 2.0
+    MAX_GROWTH = 3.0
+    GIVE_UP_AFTER = 2
+    
+    def __init__(self, path=None, adaptive=True):
+        self.path = path
+        self.adaptive = adaptive
+        self.regressions = {}
+        self.timeouts = {}
+        self._lock = threading.Lock()
+        self._history = self._load()
+    
+    @classmethod
+    def from_env(cls):
+        """LEAFLOW_ADAPTIVE_TIMEOUT 为 0 时只记录耗时，不调整超时"""
+        adaptive = os.getenv('LEAFLOW_ADAPTIVE_TIMEOUT', '1').strip() != '0'
+        return cls(os.path.join(get_state_dir(), 'step_latency.json'), adaptive)
+    
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取步骤耗时历史失败: {e}")
+            return {}
+    
+    def p99(self, step):
+        with self._lock:
+            samples = list(self._history.get(step, []))
+        if len(samples) < self.MIN_SAMPLES:
+            return None
+        return RunMetrics.percentile(sorted(samples), 99)
+    
+    def get(self, step, default):
+        """步骤的超时时间：历史 p99 × 余量，限制在 FLOOR 和固定值的 MAX_GROWTH 倍之间"""
+        p99 = self.p99(step) if self.adaptive else None
+        if p99 is None:
+            return default
+        limit = round(min(max(p99 * self.MARGIN, self.FLOOR), default * self.MAX_GROWTH), 1)
+        with self._lock:
+            gave_up = self.timeouts.get(step, 0) >= self.GIVE_UP_AFTER
+        return max(limit, default) if gave_up else limit
+    
+    def record(self, step, seconds):
+        """记录一次成功步骤的耗时，明显超过历史 p99 时标记为性能回退"""
+        p99 = self.p99(step)
+        if p99 is not None and seconds > max(p99 * self.MARGIN, self.FLOOR):
+            logger.warning(f"步骤 {step} 耗时 {seconds:.1f}s，超过历史 p99 {p99:.1f}s 的 {self.MARGIN:g} 倍")
+            with self._lock:
+                self.regressions[step] = self.regressions.get(step, 0) + 1
+        with self._lock:
+            samples = self._history.setdefault(step, [])
+            samples.append(round(seconds, 3))
+            del samples[:-self.MAX_SAMPLES]
+    
+    def record_timeout(self, step, seconds):
+        """记录一次超时：以已等待的时间作为删失样本计入历史，让过紧的超时在后续运行中放宽"""
+        with self._lock:
+            count = self.timeouts[step] = self.timeouts.get(step, 0) + 1
+            samples = self._history.setdefault(step, [])
+            samples.append(round(seconds, 3))
+            del samples[:-self.MAX_SAMPLES]
+        if count == self.GIVE_UP_AFTER:
+            logger.warning(f"步骤 {step} 本次运行已超时 {count} 次，不再收紧该步骤的超时")
+    
+    @contextlib.contextmanager
+    def measure(self, step):
+        """代码块正常结束时记录耗时，等待超时时记为删失样本，其他异常不记录"""
+        start = time.monotonic()
+        try:
+            yield
+        except (TimeoutException, TimeoutError, asyncio.TimeoutError):
+            self.record_timeout(step, time.monotonic() - start)
+            raise
+        self.record(step, time.monotonic() - start)
+    
+    def report(self):
+        if self.regressions:
+            details = ", ".join(f"{step} {count} 次" for step, count in sorted(self.regressions.items()))
+            logger.warning(f"本次运行的性能回退步骤: {details}")
+    
+    def save(self):
+        """写回历史文件"""
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self._history)
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"保存步骤耗时历史失败: {e}")
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+class WaitEngine:
+    """事件驱动的等待 - 页面就绪、网络空闲、DOM稳定或条件满足后立即返回"""
+    
+    POLL_INTERVAL = 0.1
+    
+    # 安装一次 MutationObserver，记录最后一次DOM变化和最后一个资源响应的时间。
+    # 时间都换算成 timeOrigin + now() 的绝对时间：点击导致跳转后新文档的 performance.now() 从 0 开始，
+    # 绝对时间仍然晚于跳转前的 mark，新文档安装观察器的时刻即算作一次变化
+    _ACTIVITY_SCRIPT = """
+        var origin = performance.timeOrigin;
+        if (!window.__leaflowWatch) {
+            window.__leaflowWatch = true;
+            window.__leaflowLastMutation = origin + performance.now();
+            new MutationObserver(function() {
+                window.__leaflowLastMutation = origin + performance.now();
+            }).observe(document.documentElement, {subtree: true, childList: true, attributes: true, characterData: true});
+        }
+        var lastResponse = 0;
+        var entries = performance.getEntriesByType('resource');
+        for (var i = 0; i < entries.length; i++) {
+            lastResponse = Math.max(lastResponse, origin + entries[i].responseEnd);
+        }
+        return {
+            ready: document.readyState === 'complete',
+            now: origin + performance.now(),
+            lastMutation: window.__leaflowLastMutation,
+            lastResponse: lastResponse
+        };
+    """
+    
+    def __init__(self, driver, default_timeout=20):
+        self.driver = driver
+        self.default_timeout = default_timeout
+    
+    def until(self, condition, timeout=None, message=""):
+        """轮询直到条件返回真值，超过期限抛出 TimeoutException"""
+        timeout = self.default_timeout if timeout is None else timeout
+        return WebDriverWait(self.driver, timeout, poll_frequency=self.POLL_INTERVAL).until(condition, message)
+    
+    def _activity(self):
+        return self.driver.execute_script(self._ACTIVITY_SCRIPT)
+    
+    @staticmethod
+    def _quiet(state, idle_ms, since=None):
+        """文档加载完成且在 idle_ms 内没有网络响应和DOM变化"""
+        if not state or not state['ready']:
+            return False
+        last_activity = max(state['lastMutation'], state['lastResponse'])
+        if since is not None and last_activity <= since:
+            return False
+        return state['now'] - last_activity >= idle_ms
+    
+    def page_ready(self, timeout=None, idle_ms=500):
+        """等待文档加载完成、网络空闲且DOM稳定，超时返回False"""
+        try:
+            self.until(lambda driver: self._quiet(self._activity(), idle_ms), timeout)
+            return True
+        except TimeoutException:
+            logger.debug("等待页面就绪超时")
+            return False
+    
+    def mark(self):
+        """记录当前时间点（跨页面跳转可比较），配合 settled_since 等待操作产生的变化"""
+        try:
+            return self._activity()['now']
+        except Exception:
+            return None
+    
+    def settled_since(self, mark, timeout=None, idle_ms=500):
+        """等待页面在 mark 之后发生变化并重新稳定，超时返回False"""
+        try:
+            self.until(lambda driver: self._quiet(self._activity(), idle_ms, since=mark), timeout)
+            return True
+        except TimeoutException:
+            logger.debug("等待页面变化超时")
+            return False
 
 class LeaflowAutoCheckin:
-    def __init__(self, email, password):
+    def __init__(self, email, password, driver_pool=None, session_cache=None, selector_registry=None,
+                 proxy=None, step_timeout=None, step_timeouts=None, memory_governor=None, profiler=None):
         self.email = email
         self.password = password
         self.telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
@@ -31,41 +2242,78 @@ class LeaflowAutoCheckin:
         if not self.email or not self.password:
             raise ValueError("邮箱和密码不能为空")
         
+        self.account_id = account_hash(email)
         self.driver = None
-        self.setup_driver()
+        self.proxy = proxy
+        # 使用单独代理的账号不能复用池中的浏览器
+        self.driver_pool = None if proxy else driver_pool
+        self.memory_governor = memory_governor
+        self.profiler = profiler
+        self.session_cache = session_cache
+        self.selectors = selector_registry or SelectorRegistry()
+        self.timeouts = step_timeouts or StepTimeouts()
+        # 账号单独设置的 timeout 代替各步骤的固定超时
+        self.step_override = step_timeout
+        self.step_timeout = step_timeout or get_int_env('LEAFLOW_STEP_TIMEOUT', 20)
+        self.session_restored = False
+        self._storage_script_id = None
+        with metrics.span('setup_driver', self.account_id, pooled=bool(self.driver_pool)):
+            if self.driver_pool:
+                self.driver = self.driver_pool.acquire()
+            else:
+                self.setup_driver()
+        watchdog.attach(self.driver)
+        if self.memory_governor:
+            self.memory_governor.attach(self.driver)
+        self.waiter = WaitEngine(self.driver, self.step_timeout)
+        self.network = NetworkCapture() if network_capture_enabled() else None
+        self.trace_events = [] if self.profiler and trace_enabled() else None
+        if self.network or self.profiler:
+            # 丢弃复用的浏览器中上一个账号留下的日志
+            drain_performance_log(self.driver)
+        if self.profiler:
+            try:
+                self.driver.execute_cdp_cmd('Performance.enable', {})
+            except Exception as e:
+                logger.debug(f"启用 Performance 域失败: {e}")
     
     def setup_driver(self):
         """设置Chrome驱动选项"""
-        chrome_options = Options()
-        
-        # GitHub Actions环境配置
-        if os.getenv('GITHUB_ACTIONS'):
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--window-size=1920,1080')
-        
-        # 通用配置
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
-        self.driver = webdriver.Chrome(options=chrome_options)
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
+        self.driver = create_chrome_driver(self.proxy)
+    
+    def close_driver(self):
+        """归还或关闭浏览器实例"""
+        if not self.driver:
+            return
+        if self.driver_pool:
+            if self._storage_script_id:
+                try:
+                    self.driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {
+                        "identifier": self._storage_script_id
+                    })
+                except Exception:
+                    pass
+            self.driver_pool.release(self.driver)
+        else:
+            quit_driver(self.driver)
+        self.driver = None
+    
+    @timed('close_popup')
     def close_popup(self):
         """关闭初始弹窗"""
         try:
             logger.info("尝试关闭初始弹窗...")
-            time.sleep(3)  # 等待弹窗加载
+            self.waiter.page_ready(timeout=10)  # 等待弹窗加载
             
             # 尝试关闭弹窗
             try:
-                actions = ActionChains(self.driver)
-                actions.move_by_offset(10, 10).click().perform()
+                # 使用绝对坐标点击，避免复用浏览器时指针偏移累积
+                actions = ActionBuilder(self.driver)
+                actions.pointer_action.move_to_location(10, 10).click()
+                mark = self.waiter.mark()
+                actions.perform()
                 logger.info("已成功关闭弹窗")
-                time.sleep(2)
+                self.waiter.settled_since(mark, timeout=3, idle_ms=300)
                 return True
             except:
                 pass
@@ -77,23 +2325,158 @@ class LeaflowAutoCheckin:
     
     def wait_for_element_clickable(self, by, value, timeout=10):
         """等待元素可点击"""
-        return WebDriverWait(self.driver, timeout).until(
-            EC.element_to_be_clickable((by, value))
-        )
+        with metrics.span('selector_probe', self.account_id, selector=value):
+            return WebDriverWait(self.driver, timeout).until(
+                EC.element_to_be_clickable((by, value))
+            )
     
     def wait_for_element_present(self, by, value, timeout=10):
         """等待元素出现"""
-        return WebDriverWait(self.driver, timeout).until(
-            EC.presence_of_element_located((by, value))
-        )
+        with metrics.span('selector_probe', self.account_id, selector=value):
+            return WebDriverWait(self.driver, timeout).until(
+                EC.presence_of_element_located((by, value))
+            )
+    
+    def pump_performance_log(self):
+        """读取性能日志，Network 事件交给网络捕获，trace 事件暂存给性能剖析"""
+        for method, params in drain_performance_log(self.driver):
+            if method.startswith('Network.'):
+                if self.network:
+                    self.network.handle(method, params)
+            elif method == 'Tracing.dataCollected' and self.trace_events is not None:
+                self.trace_events.append(params)
+    
+    def record_page(self, page):
+        """页面加载完成后记录加载统计，开启性能剖析时保存慢页面的详细数据"""
+        page_stats.collect(self.driver, page)
+        if not self.profiler:
+            return
+        self.pump_performance_log()
+        trace_events = self.trace_events
+        if trace_events is not None:
+            self.trace_events = []
+        self.profiler.capture(self.driver, page, self.account_id, trace_events)
+    
+    def collect_network(self):
+        """处理性能日志中的新事件，读取已完成的 JSON 响应内容"""
+        if not self.network:
+            return None
+        self.pump_performance_log()
+        for request_id, request in self.network.take_finished():
+            try:
+                body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+                self.network.add_body(request, body.get('body', ''), body.get('base64Encoded', False))
+            except Exception as e:
+                logger.debug(f"读取接口响应失败: {e}")
+        return self.network
+    
+    def step_limit(self, step):
+        """步骤的超时：账号设置的 timeout 或固定值，再按历史耗时自适应调整"""
+        return self.timeouts.get(step, self.step_override or STEP_DEFAULTS[step])
+    
+    def locate_first(self, step, selectors, timeout, enabled_only=False, message=""):
+        """在同一个轮询循环里同时探测所有候选选择器（CSS 或 XPath），共用一个期限
+        
+        返回 (元素, 命中的选择器)，期限内都没有可见元素时抛出 TimeoutException。
+        """
+        ordered = self.selectors.order(step, selectors)
+        try:
+            with metrics.span('locate_first', self.account_id, step=step, candidates=len(ordered)):
+                found = self.waiter.until(
+                    lambda driver: driver.execute_script(LOCATE_FIRST_SCRIPT, ordered, enabled_only),
+                    timeout, message
+                )
+        except TimeoutException:
+            self.selectors.record_winner(step, ordered, None)
+            raise
+        self.selectors.record_winner(step, ordered, found['selector'])
+        return found['element'], found['selector']
+    
+    def probe_dom(self, selectors, include_body=False, limit=50):
+        """一次往返批量探测候选选择器，返回 {matches: {选择器: [元素信息]}, bodyText}"""
+        with metrics.span('dom_probe', self.account_id, selectors=len(selectors)):
+            result = self.driver.execute_script(DOM_PROBE_SCRIPT, list(selectors), include_body, limit) or {}
+        result.setdefault('matches', {})
+        result.setdefault('bodyText', '')
+        return result
+    
+    def restore_session(self):
+        """从缓存恢复登录状态，成功后可跳过登录流程"""
+        if not self.session_cache:
+            return False
+        
+        state = self.session_cache.load(self.email, self.password)
+        if not state or not state.get('cookies'):
+            return False
+        
+        if not self.validate_session(state['cookies']):
+            logger.info("缓存的登录状态已失效，需要重新登录")
+            self.session_cache.delete(self.email)
+            return False
+        
+        try:
+            self.driver.execute_cdp_cmd("Network.setCookies", {
+                "cookies": SessionCache.cookie_params(state['cookies'])
+            })
+            local_storage = state.get('local_storage') or {}
+            if local_storage:
+                result = self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+                    "source": SessionCache.storage_script(local_storage)
+                })
+                self._storage_script_id = result.get('identifier')
+        except Exception as e:
+            logger.warning(f"恢复登录状态失败: {e}")
+            return False
+        
+        logger.info("已恢复缓存的登录状态，跳过登录")
+        self.session_restored = True
+        return True
+    
+    @staticmethod
+    def validate_session(cookies):
+        """通过一次轻量的HTTP请求确认会话仍然有效"""
+        session = requests.Session()
+        for cookie in cookies:
+            session.cookies.set(cookie['name'], cookie['value'],
+                                domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        try:
+            response = session.get(f"{LEAFLOW_BASE_URL}/dashboard", allow_redirects=False, timeout=10)
+        except requests.RequestException as e:
+            logger.warning(f"验证登录状态时出错: {e}")
+            return False
+        finally:
+            session.close()
+        return response.status_code == 200
+    
+    def save_session(self):
+        """登录成功后加密保存Cookie和本地存储"""
+        if not self.session_cache:
+            return
+        try:
+            cookies = self.driver.execute_cdp_cmd("Network.getAllCookies", {}).get('cookies', [])
+            cookies = [c for c in cookies if c.get('domain', '').lstrip('.').endswith(LEAFLOW_HOSTNAME)]
+            local_storage = {}
+            if self.driver.current_url.startswith(LEAFLOW_BASE_URL):
+                local_storage = self.driver.execute_script("return Object.assign({}, window.localStorage);") or {}
+            self.session_cache.save(self.email, self.password, {
+                'cookies': cookies,
+                'local_storage': local_storage,
+                'saved_at': time.time()
+            })
+            logger.info("登录状态已缓存")
+        except Exception as e:
+            logger.warning(f"保存登录状态失败: {e}")
     
+    @timed('login')
     def login(self):
         """执行登录流程"""
         logger.info(f"开始登录流程")
+        throttle()
         
         # 访问登录页面
-        self.driver.get("https://leaflow.net/login")
-        time.sleep(5)
+        self.driver.get(f"{LEAFLOW_BASE_URL}/login")
+        self.waiter.page_ready()
+        self.record_page('login')
         
         # 关闭弹窗
         self.close_popup()
@@ -102,37 +2485,19 @@ class LeaflowAutoCheckin:
         try:
             logger.info("查找邮箱输入框...")
             
-            # 等待页面稳定
-            time.sleep(2)
-            
-            # 尝试多种选择器找到邮箱输入框
-            email_selectors = [
-                "input[type='text']",
-                "input[type='email']", 
-                "input[placeholder*='邮箱']",
-                "input[placeholder*='邮件']",
-                "input[placeholder*='email']",
-                "input[name='email']",
-                "input[name='username']"
-            ]
-            
-            email_input = None
-            for selector in email_selectors:
-                try:
-                    email_input = self.wait_for_element_clickable(By.CSS_SELECTOR, selector, 5)
-                    logger.info(f"找到邮箱输入框")
-                    break
-                except:
-                    continue
-            
-            if not email_input:
+            # 同时探测多种选择器找到邮箱输入框
+            try:
+                with self.timeouts.measure('login_email'):
+                    email_input, _ = self.locate_first('login_email', EMAIL_SELECTORS,
+                                                       self.step_limit('login_email'), enabled_only=True)
+                logger.info(f"找到邮箱输入框")
+            except TimeoutException:
                 raise Exception("找不到邮箱输入框")
             
             # 清除并输入邮箱
             email_input.clear()
             email_input.send_keys(self.email)
             logger.info("邮箱输入完成")
-            time.sleep(2)
             
         except Exception as e:
             logger.error(f"输入邮箱时出错: {e}")
@@ -140,7 +2505,6 @@ class LeaflowAutoCheckin:
             try:
                 self.driver.execute_script(f"document.querySelector('input[type=\"text\"], input[type=\"email\"]').value = '{self.email}';")
                 logger.info("通过JavaScript设置邮箱")
-                time.sleep(2)
             except:
                 raise Exception(f"无法输入邮箱: {e}")
         
@@ -149,14 +2513,14 @@ class LeaflowAutoCheckin:
             logger.info("查找密码输入框...")
             
             # 等待密码框出现
-            password_input = self.wait_for_element_clickable(
-                By.CSS_SELECTOR, "input[type='password']", 10
-            )
+            with self.timeouts.measure('login_password'):
+                password_input = self.wait_for_element_clickable(
+                    By.CSS_SELECTOR, PASSWORD_SELECTOR, self.step_limit('login_password')
+                )
             
             password_input.clear()
             password_input.send_keys(self.password)
             logger.info("密码输入完成")
-            time.sleep(1)
             
         except TimeoutException:
             raise Exception("找不到密码输入框")
@@ -164,27 +2528,12 @@ class LeaflowAutoCheckin:
         # 点击登录按钮
         try:
             logger.info("查找登录按钮...")
-            login_btn_selectors = [
-                "//button[contains(text(), '登录')]",
-                "//button[contains(text(), 'Login')]",
-                "//button[@type='submit']",
-                "//input[@type='submit']",
-                "button[type='submit']"
-            ]
-            
-            login_btn = None
-            for selector in login_btn_selectors:
-                try:
-                    if selector.startswith("//"):
-                        login_btn = self.wait_for_element_clickable(By.XPATH, selector, 5)
-                    else:
-                        login_btn = self.wait_for_element_clickable(By.CSS_SELECTOR, selector, 5)
-                    logger.info(f"找到登录按钮")
-                    break
-                except:
-                    continue
-            
-            if not login_btn:
+            try:
+                with self.timeouts.measure('login_button'):
+                    login_btn, _ = self.locate_first('login_button', LOGIN_BUTTON_SELECTORS,
+                                                     self.step_limit('login_button'), enabled_only=True)
+                logger.info(f"找到登录按钮")
+            except TimeoutException:
                 raise Exception("找不到登录按钮")
             
             login_btn.click()
@@ -195,13 +2544,13 @@ class LeaflowAutoCheckin:
         
         # 等待登录完成
         try:
-            WebDriverWait(self.driver, 20).until(
-                lambda driver: "dashboard" in driver.current_url or "workspaces" in driver.current_url or "login" not in driver.current_url
-            )
+            with self.timeouts.measure('login_redirect'):
+                self.waiter.until(lambda driver: is_login_url(driver.current_url),
+                                  timeout=self.step_limit('login_redirect'))
             
             # 检查当前URL确认登录成功
             current_url = self.driver.current_url
-            if "dashboard" in current_url or "workspaces" in current_url or "login" not in current_url:
+            if is_login_url(current_url):
                 logger.info(f"登录成功，当前URL: {current_url}")
                 return True
             else:
@@ -210,8 +2559,7 @@ class LeaflowAutoCheckin:
         except TimeoutException:
             # 检查是否登录失败
             try:
-                error_selectors = [".error", ".alert-danger", "[class*='error']", "[class*='danger']"]
-                for selector in error_selectors:
+                for selector in LOGIN_ERROR_SELECTORS:
                     try:
                         error_msg = self.driver.find_element(By.CSS_SELECTOR, selector)
                         if error_msg.is_displayed():
@@ -222,46 +2570,37 @@ class LeaflowAutoCheckin:
             except Exception as e:
                 raise e
     
+    @timed('get_balance')
     def get_balance(self):
         """获取当前账号的总余额"""
         try:
             logger.info("获取账号余额...")
             
+            # 签到页面已经请求过的接口中有余额时，不再打开仪表板
+            network = self.collect_network()
+            balance = network and network.balance()
+            if balance:
+                return f"{balance}元"
+            
             # 跳转到仪表板页面
-            self.driver.get("https://leaflow.net/dashboard")
-            time.sleep(3)
+            self.driver.get(f"{LEAFLOW_BASE_URL}/dashboard")
             
-            # 等待页面加载
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
+            # 等待页面加载完成且余额数据渲染稳定
+            self.waiter.page_ready()
+            self.record_page('dashboard')
+            
+            network = self.collect_network()
+            balance = network and network.balance()
+            if balance:
+                return f"{balance}元"
             
             # 尝试多种选择器查找余额元素
-            balance_selectors = [
-                "//*[contains(text(), '¥') or contains(text(), '￥') or contains(text(), '元')]",
-                "//*[contains(@class, 'balance')]",
-                "//*[contains(@class, 'money')]",
-                "//*[contains(@class, 'amount')]",
-                "//button[contains(@class, 'dollar')]",
-                "//span[contains(@class, 'font-medium')]"
-            ]
-            
-            for selector in balance_selectors:
-                try:
-                    elements = self.driver.find_elements(By.XPATH, selector)
-                    for element in elements:
-                        text = element.text.strip()
-                        # 查找包含数字和货币符号的文本
-                        if any(char.isdigit() for char in text) and ('¥' in text or '￥' in text or '元' in text):
-                            # 提取数字部分
-                            import re
-                            numbers = re.findall(r'\d+\.?\d*', text)
-                            if numbers:
-                                balance = numbers[0]
-                                logger.info(f"找到余额: {balance}元")
-                                return f"{balance}元"
-                except:
-                    continue
+            balance_selectors = self.selectors.order('balance', BALANCE_SELECTORS)
+            balance, selector = balance_from_probe(self.probe_dom(balance_selectors), balance_selectors)
+            self.selectors.record_winner('balance', balance_selectors, selector)
+            if balance:
+                logger.info(f"找到余额: {balance}元")
+                return f"{balance}元"
             
             logger.warning("未找到余额信息")
             return "未知"
@@ -270,223 +2609,1119 @@ class LeaflowAutoCheckin:
             logger.warning(f"获取余额时出错: {e}")
             return "未知"
     
-    def wait_for_checkin_page_loaded(self, max_retries=3, wait_time=20):
-        """等待签到页面完全加载，支持重试"""
-        for attempt in range(max_retries):
-            logger.info(f"等待签到页面加载，尝试 {attempt + 1}/{max_retries}，等待 {wait_time} 秒...")
-            time.sleep(wait_time)
-            
+    @timed('wait_for_checkin_page_loaded')
+    def wait_for_checkin_page_loaded(self, max_retries=3):
+        """等待签到页面完全加载，支持重试；每次超时都计入自适应超时，下一次尝试按放宽后的期限等待"""
+        for attempt in range(max_retries):
+            wait_time = self.step_limit('checkin_page')
+            logger.info(f"等待签到页面加载，尝试 {attempt + 1}/{max_retries}，最多等待 {wait_time} 秒...")
+            
+            try:
+                # 检查页面是否包含签到相关元素
+                try:
+                    with self.timeouts.measure('checkin_page'):
+                        self.waiter.page_ready(timeout=wait_time)
+                        self.locate_first('checkin_indicator', CHECKIN_INDICATORS, wait_time)
+                    logger.info(f"找到签到页面元素")
+                    return True
+                except TimeoutException:
+                    pass
+                
+                logger.warning(f"第 {attempt + 1} 次尝试未找到签到按钮，继续等待...")
+                
+            except Exception as e:
+                logger.warning(f"第 {attempt + 1} 次检查签到页面时出错: {e}")
+        
+        return False
+    
+    @timed('find_and_click_checkin_button')
+    def find_and_click_checkin_button(self):
+        """查找并点击签到按钮 - 处理已签到状态"""
+        logger.info("查找签到按钮...")
+        
+        try:
+            # 先等待页面可能的重载
+            self.waiter.page_ready(timeout=5)
+            
+            # 所有候选选择器共用一个期限
+            try:
+                with self.timeouts.measure('checkin_button'):
+                    checkin_btn, _ = self.locate_first('checkin_button', CHECKIN_BUTTON_SELECTORS,
+                                                       self.step_limit('checkin_button'))
+            except TimeoutException:
+                logger.error("找不到签到按钮")
+                return False
+            
+            # 检查按钮文本，如果包含"已签到"则说明今天已经签到过了
+            btn_text = checkin_btn.text.strip()
+            if "已签到" in btn_text:
+                logger.info("伙计，今日你已经签到过了！")
+                return "already_checked_in"
+            
+            # 检查按钮是否可用
+            if checkin_btn.is_enabled():
+                logger.info(f"找到并点击立即签到按钮")
+                checkin_btn.click()
+                return True
+            else:
+                logger.info("签到按钮不可用，可能已经签到过了")
+                return "already_checked_in"
+                    
+        except Exception as e:
+            logger.error(f"查找签到按钮时出错: {e}")
+            return False
+    
+    def checkin(self):
+        """执行签到流程"""
+        logger.info("跳转到签到页面...")
+        
+        # 跳转到签到页面
+        self.driver.get(LEAFLOW_CHECKIN_URL)
+        
+        # 等待签到页面加载（最多重试3次）
+        if not self.wait_for_checkin_page_loaded(max_retries=3):
+            raise Exception("签到页面加载失败，无法找到签到相关元素")
+        self.record_page('checkin')
+        
+        # 查找并点击立即签到按钮
+        throttle()
+        mark = self.waiter.mark()
+        checkin_result = self.find_and_click_checkin_button()
+        
+        if checkin_result == "already_checked_in":
+            return "今日已签到"
+        elif checkin_result is True:
+            logger.info("已点击立即签到按钮")
+            # 等待签到结果
+            start = time.monotonic()
+            if self.waiter.settled_since(mark, timeout=self.step_limit('checkin_settle')):
+                self.timeouts.record('checkin_settle', time.monotonic() - start)
+            else:
+                self.timeouts.record_timeout('checkin_settle', time.monotonic() - start)
+            
+            # 获取签到结果
+            result_message = self.get_checkin_result()
+            return result_message
+        else:
+            raise Exception("找不到立即签到按钮或按钮不可点击")
+    
+    @timed('get_checkin_result')
+    def get_checkin_result(self):
+        """获取签到结果消息"""
+        try:
+            # 给页面一些时间显示结果
+            self.waiter.page_ready(timeout=3, idle_ms=300)
+            
+            # 优先使用签到接口返回的消息
+            network = self.collect_network()
+            result = network and network.checkin_result()
+            if result:
+                return result
+            
+            # 消息元素、页面文本和签到按钮状态一次取回
+            probe = self.probe_dom(CHECKIN_RESULT_SELECTORS + ["button.checkin-btn"], include_body=True, limit=1)
+            return result_from_probe(probe)
+            
+        except Exception as e:
+            return f"获取签到结果时出错: {str(e)}"
+    
+    @timed('account')
+    def run(self):
+        """单个账号执行流程"""
+        try:
+            logger.info(f"开始处理账号")
+            
+            # 优先恢复缓存的登录状态，失效时再走完整登录
+            logged_in = self.restore_session()
+            if not logged_in:
+                logged_in = self.login()
+                if logged_in:
+                    self.save_session()
+            
+            if logged_in:
+                # 签到
+                result = self.checkin()
+                
+                # 获取余额
+                balance = self.get_balance()
+                
+                logger.info(f"签到结果: {result}, 余额: {balance}")
+                return True, result, balance
+            else:
+                raise Exception("登录失败")
+                
+        except Exception as e:
+            error_msg = f"自动签到失败: {str(e)}"
+            logger.error(error_msg)
+            if self.session_restored and self.session_cache:
+                # 恢复的会话可能已在服务端失效，下次重新登录
+                self.session_cache.delete(self.email)
+            return False, error_msg, "未知"
+        
+        finally:
+            self.close_driver()
+
+class HttpFallback(Exception):
+    """HTTP快速通道无法处理当前页面，需要回退到浏览器流程"""
+
+class HttpSessionExpired(HttpFallback):
+    """签到页面跳转到了登录页面，当前登录状态已失效"""
+
+class HttpCheckinClient:
+    """HTTP快速通道 - 不启动浏览器，直接用 requests 完成登录、签到和余额查询"""
+    
+    USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    
+    # 人机验证或风控页面的特征
+    CHALLENGE_MARKERS = ("cf-chl", "challenge-platform", "Just a moment", "captcha", "turnstile")
+    
+    # 所有账号共用同一个连接池（keep-alive），Cookie 仍由各自的 Session 隔离
+    _adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    
+    def __init__(self, email, password, timeout=15, proxy=None, session_cache=None):
+        self.account_id = account_hash(email)
+        self.email = email
+        self.password = password
+        self.timeout = timeout
+        self.session_cache = session_cache
+        self.session = requests.Session()
+        if proxy:
+            self.session.proxies = {"http": proxy, "https": proxy}
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.session.headers.update({
+            "User-Agent": self.USER_AGENT,
+            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8"
+        })
+    
+    def request(self, method, url, **kwargs):
+        """发送请求，遇到风控、异常状态码或网络错误时抛出 HttpFallback"""
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise HttpFallback(f"请求失败: {e}")
+        
+        if response.status_code in (403, 429, 503) or any(marker in response.text for marker in self.CHALLENGE_MARKERS):
+            raise HttpFallback(f"遇到人机验证或访问限制 (HTTP {response.status_code})")
+        if response.status_code >= 400:
+            raise HttpFallback(f"意外的响应状态 HTTP {response.status_code}")
+        return response
+    
+    @staticmethod
+    def tag_attr(tag, name):
+        """读取标签属性值，兼容单引号、双引号和无引号写法"""
+        match = re.search(rf'\b{name}\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', tag, re.I)
+        if not match:
+            return None
+        return html.unescape(next(group for group in match.groups() if group is not None))
+    
+    @classmethod
+    def csrf_token(cls, markup):
+        """从页面的 meta 标签或隐藏字段中提取 CSRF token"""
+        for tag in re.findall(r'(?i)<(?:meta|input)\b[^>]*>', markup):
+            if cls.tag_attr(tag, 'name') in ('csrf-token', '_token'):
+                token = cls.tag_attr(tag, 'content') or cls.tag_attr(tag, 'value')
+                if token:
+                    return token
+        return None
+    
+    @classmethod
+    def find_checkin_form(cls, markup):
+        """查找包含签到按钮的表单，返回 (action, 表单字段)"""
+        for match in re.finditer(r'(?is)<form([^>]*)>(.*?)</form>', markup):
+            attrs, body = match.groups()
+            if 'checkin' not in body and '签到' not in body:
+                continue
+            fields = {}
+            for field in re.finditer(r'(?i)<(?:input|button)\b[^>]*>', body):
+                name = cls.tag_attr(field.group(0), 'name')
+                if name:
+                    fields[name] = cls.tag_attr(field.group(0), 'value') or ''
+            return cls.tag_attr(attrs, 'action') or '', fields
+        return None
+    
+    def login(self):
+        """提交登录表单"""
+        login_url = f"{LEAFLOW_BASE_URL}/login"
+        throttle()
+        page = self.request("GET", login_url)
+        token = self.csrf_token(page.text)
+        if not token:
+            raise HttpFallback("登录页面中没有找到 CSRF token")
+        
+        response = self.request("POST", login_url, data={
+            "_token": token,
+            "email": self.email,
+            "password": self.password,
+            "remember": "on"
+        }, headers={"Referer": login_url})
+        
+        if "/login" in response.url:
+            # 可能是密码错误，也可能是前端渲染的登录流程，交给浏览器确认
+            raise HttpFallback("登录后仍停留在登录页面")
+        logger.info("HTTP登录成功")
+    
+    def restore_session(self):
+        """从缓存恢复登录状态（与浏览器流程共用同一份缓存），签到页面确认是否仍然有效"""
+        if not self.session_cache:
+            return False
+        state = self.session_cache.load(self.email, self.password)
+        if not state or not state.get('cookies'):
+            return False
+        for cookie in state['cookies']:
+            self.session.cookies.set(cookie['name'], cookie['value'],
+                                     domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        logger.info("已恢复缓存的登录状态，跳过登录")
+        return True
+    
+    def save_session(self):
+        """登录成功后加密保存Cookie，格式与浏览器流程相同"""
+        if not self.session_cache:
+            return
+        cookies = [cookie for cookie in SessionCache.cookies_from_jar(self.session.cookies)
+                   if cookie['domain'].lstrip('.').endswith(LEAFLOW_HOSTNAME)]
+        try:
+            self.session_cache.save(self.email, self.password, {
+                'cookies': cookies,
+                'local_storage': {},
+                'saved_at': time.time()
+            })
+            logger.info("登录状态已缓存")
+        except OSError as e:
+            logger.warning(f"保存登录状态失败: {e}")
+    
+    def checkin(self):
+        """读取签到页面并提交签到表单"""
+        page = self.request("GET", LEAFLOW_CHECKIN_URL)
+        if "/login" in page.url:
+            raise HttpSessionExpired("签到页面跳转到了登录页面")
+        
+        form = self.find_checkin_form(page.text)
+        if not form:
+            if self.shows_checked_in(page.text):
+                logger.info("伙计，今日你已经签到过了！")
+                return "今日已签到"
+            raise HttpFallback("签到页面中没有识别到签到表单")
+        
+        action, fields = form
+        url = requests.compat.urljoin(page.url, action or page.url)
+        throttle()
+        response = self.request("POST", url, data=fields, headers={"Referer": page.url})
+        
+        if "application/json" in response.headers.get("Content-Type", ""):
+            try:
+                data = response.json()
+            except ValueError:
+                raise HttpFallback("签到接口返回的不是有效的JSON")
+            message = data.get("message") or data.get("msg") if isinstance(data, dict) else None
+            message = message and not json_reports_failure(data) and json_checkin_message(message)
+            if message:
+                return message
+            raise HttpFallback("签到接口返回了无法识别的数据")
+        
+        # 只接受明确的成功/已签到消息，页面标题等其他含“签到”的行不算结果
+        result_line = confirmed_result_line(html_to_text(response.text))
+        if result_line:
+            return result_line
+        return self.confirm_checked_in()
+    
+    @staticmethod
+    def shows_checked_in(markup):
+        """签到页面显示已签到，且没有可点击的立即签到按钮"""
+        page_text = html_to_text(markup)
+        return "已签到" in page_text and "立即签到" not in page_text
+    
+    def confirm_checked_in(self):
+        """提交后没有明确的结果消息时重新读取签到页面确认状态，仍无法确认则交给浏览器流程"""
+        page = self.request("GET", LEAFLOW_CHECKIN_URL)
+        if "/login" in page.url:
+            raise HttpSessionExpired("签到页面跳转到了登录页面")
+        if self.shows_checked_in(page.text):
+            logger.info("签到页面已显示今日已签到")
+            return "今日已签到"
+        raise HttpFallback("签到响应中没有明确的结果，且签到页面未显示已签到")
+    
+    def get_balance(self):
+        """从仪表板页面读取余额"""
+        try:
+            page = self.request("GET", f"{LEAFLOW_BASE_URL}/dashboard")
+        except HttpFallback as e:
+            logger.warning(f"获取余额时出错: {e}")
+            return "未知"
+        
+        for line in html_to_text(page.text).split('\n'):
+            balance = parse_balance(line)
+            if balance:
+                logger.info(f"找到余额: {balance}元")
+                return f"{balance}元"
+        logger.warning("未找到余额信息")
+        return "未知"
+    
+    @timed('http_fast_path')
+    def run(self):
+        """单个账号执行流程，返回值与 LeaflowAutoCheckin.run 相同"""
+        logger.info("尝试通过HTTP快速通道处理账号")
+        restored = self.restore_session()
+        if not restored:
+            self.login()
+            self.save_session()
+        try:
+            result = self.checkin()
+        except HttpSessionExpired:
+            if not restored:
+                raise
+            logger.info("缓存的登录状态已失效，需要重新登录")
+            self.session_cache.delete(self.email)
+            self.session.cookies.clear()
+            self.login()
+            self.save_session()
+            result = self.checkin()
+        balance = self.get_balance()
+        logger.info(f"签到结果: {result}, 余额: {balance}")
+        return True, result, balance
+
+class CdpError(Exception):
+    """CDP 命令返回错误或连接已断开"""
+
+def find_chrome_binary():
+    """查找 Chrome 可执行文件，可用 LEAFLOW_CHROME_BINARY 指定"""
+    path = os.getenv('LEAFLOW_CHROME_BINARY', '').strip() or next(filter(None, map(shutil.which, CHROME_NAMES)), None)
+    if path:
+        return path
+    raise CdpError("找不到 Chrome 可执行文件，请设置 LEAFLOW_CHROME_BINARY")
+
+class CdpBrowser:
+    """直接通过 DevTools 协议控制的 Chrome 进程，所有账号共用一个 websocket 连接"""
+    
+    def __init__(self):
+        self.process = None
+        self.profile_dir = None
+        self.ws = None
+        self._next_id = 0
+        self._pending = {}
+        self._listeners = {}
+        self._reader = None
+    
+    @classmethod
+    async def launch(cls, timeout=30):
+        """启动 Chrome 并连接到浏览器级别的 DevTools websocket"""
+        try:
+            import websockets
+        except ImportError:
+            raise CdpError("asyncio 模式需要安装 websockets")
+        
+        self = cls()
+        # 已有配置模板时直接复制使用，不在这里生成（生成模板需要 chromedriver）
+        if profile_template_enabled() and profile_template_ready(profile_template_dir()):
+            self.profile_dir = await asyncio.to_thread(clone_profile_template)
+        self.profile_dir = self.profile_dir or tempfile.mkdtemp(prefix='leaflow-cdp-')
+        arguments = [find_chrome_binary(), '--remote-debugging-port=0', f'--user-data-dir={self.profile_dir}']
+        arguments += build_chrome_options().arguments
+        arguments.append('about:blank')
+        self.process = await asyncio.create_subprocess_exec(
+            *arguments, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        
+        # Chrome 启动后把实际端口和 websocket 路径写入 DevToolsActivePort
+        port_file = os.path.join(self.profile_dir, 'DevToolsActivePort')
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        lines = []
+        while len(lines) < 2:
+            if self.process.returncode is not None:
+                await self.close()
+                raise CdpError(f"Chrome 启动失败，退出码 {self.process.returncode}")
+            if loop.time() > deadline:
+                await self.close()
+                raise CdpError("等待 Chrome DevTools 端口超时")
+            await asyncio.sleep(0.05)
+            try:
+                with open(port_file, 'r') as f:
+                    lines = f.read().split()
+            except OSError:
+                lines = []
+        
+        self.ws = await websockets.connect(f"ws://127.0.0.1:{lines[0]}{lines[1]}", max_size=None, ping_interval=None)
+        self._reader = asyncio.create_task(self._read_loop())
+        logger.info("已通过 DevTools 协议连接 Chrome")
+        return self
+    
+    def listen(self, session_id, callback):
+        """按会话订阅事件，callback(method, params)；callback 为 None 时取消订阅"""
+        if callback:
+            self._listeners[session_id] = callback
+        else:
+            self._listeners.pop(session_id, None)
+    
+    async def _read_loop(self):
+        """分发命令响应和已订阅会话的事件"""
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if 'method' in message:
+                    callback = self._listeners.get(message.get('sessionId'))
+                    if callback:
+                        callback(message['method'], message.get('params', {}))
+                    continue
+                future = self._pending.get(message.get('id'))
+                if future and not future.done():
+                    future.set_result(message)
+        except Exception as e:
+            logger.debug(f"CDP 连接读取结束: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CdpError("CDP 连接已断开"))
+    
+    async def send(self, method, params=None, session_id=None, timeout=30):
+        """发送 CDP 命令并等待结果"""
+        self._next_id += 1
+        message_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        try:
+            await self.ws.send(json.dumps(message))
+            response = await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+        if 'error' in response:
+            raise CdpError(f"{method}: {response['error'].get('message')}")
+        return response.get('result', {})
+    
+    async def close(self):
+        """关闭浏览器和连接，清理临时配置目录"""
+        if self.ws:
+            try:
+                await self.send('Browser.close', timeout=5)
+            except Exception:
+                pass
+            await self.ws.close()
+        if self._reader:
+            self._reader.cancel()
+        if self.process and self.process.returncode is None:
+            try:
+                await asyncio.wait_for(self.process.wait(), 5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+class AsyncCdpCheckin:
+    """asyncio 模式下的单账号签到流程，每个账号使用独立的浏览器上下文"""
+    
+    def __init__(self, browser, email, password, selector_registry=None, step_timeout=None, proxy=None,
+                 step_timeouts=None, session_cache=None):
+        self.browser = browser
+        self.session_cache = session_cache
+        self.session_restored = False
+        self.timeouts = step_timeouts or StepTimeouts()
+        self.proxy = proxy
+        self.email = email
+        self.password = password
+        self.account_id = account_hash(email)
+        self.selectors = selector_registry or SelectorRegistry()
+        # 与线程模式相同：账号单独设置的 timeout 代替各步骤的固定超时
+        self.step_override = step_timeout
+        self.step_timeout = step_timeout or get_int_env('LEAFLOW_STEP_TIMEOUT', 20)
+        self.context_id = None
+        self.session_id = None
+        self.network = NetworkCapture() if network_capture_enabled() else None
+    
+    def step_limit(self, step):
+        """步骤的超时：账号设置的 timeout 或固定值，再按历史耗时自适应调整"""
+        return self.timeouts.get(step, self.step_override or STEP_DEFAULTS[step])
+    
+    async def send(self, method, params=None, timeout=None):
+        return await self.browser.send(method, params, self.session_id, timeout or self.step_timeout)
+    
+    async def call(self, script, *args):
+        """在页面中以 arguments 调用脚本，返回 JSON 结果"""
+        expression = f"(function(){{{script}}}).apply(null, {json.dumps(list(args))})"
+        result = await self.send('Runtime.evaluate', {'expression': expression, 'returnByValue': True})
+        if 'exceptionDetails' in result:
+            raise CdpError(result['exceptionDetails'].get('text', '页面脚本执行出错'))
+        return result.get('result', {}).get('value')
+    
+    async def until(self, check, timeout=None, message="等待超时"):
+        """轮询协程 check 直到返回真值，和 WaitEngine.until 的语义一致"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.step_timeout)
+        while True:
             try:
-                # 检查页面是否包含签到相关元素
-                checkin_indicators = [
-                    "button.checkin-btn",  # 优先使用这个选择器
-                    "//button[contains(text(), '立即签到')]",
-                    "//button[contains(text(), '已签到')]",
-                    "//*[contains(text(), '每日签到')]",
-                    "//*[contains(text(), '签到')]"
-                ]
-                
-                for indicator in checkin_indicators:
-                    try:
-                        if indicator.startswith("//"):
-                            element = WebDriverWait(self.driver, 10).until(
-                                EC.presence_of_element_located((By.XPATH, indicator))
-                            )
-                        else:
-                            element = WebDriverWait(self.driver, 10).until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, indicator))
-                            )
-                        
-                        if element.is_displayed():
-                            logger.info(f"找到签到页面元素")
-                            return True
-                    except:
-                        continue
-                
-                logger.warning(f"第 {attempt + 1} 次尝试未找到签到按钮，继续等待...")
-                
+                value = await check()
+                if value:
+                    return value
+            except CdpError:
+                # 页面跳转过程中执行上下文可能被销毁，继续轮询
+                pass
+            if loop.time() >= deadline:
+                raise TimeoutError(message)
+            await asyncio.sleep(WaitEngine.POLL_INTERVAL)
+    
+    async def page_ready(self, timeout=None, idle_ms=500):
+        """等待文档加载完成、网络空闲且DOM稳定，超时返回False"""
+        async def check():
+            return WaitEngine._quiet(await self.call(WaitEngine._ACTIVITY_SCRIPT), idle_ms)
+        try:
+            await self.until(check, timeout)
+            return True
+        except TimeoutError:
+            return False
+    
+    async def navigate(self, url):
+        await self.send('Page.navigate', {'url': url})
+        await self.page_ready()
+    
+    async def current_url(self):
+        return await self.call("return location.href;")
+    
+    async def open(self):
+        """创建隔离的浏览器上下文和标签页"""
+        params = {'disposeOnDetach': True}
+        if self.proxy:
+            params['proxyServer'] = self.proxy
+        result = await self.browser.send('Target.createBrowserContext', params)
+        self.context_id = result['browserContextId']
+        result = await self.browser.send('Target.createTarget', {'url': 'about:blank', 'browserContextId': self.context_id})
+        result = await self.browser.send('Target.attachToTarget', {'targetId': result['targetId'], 'flatten': True})
+        self.session_id = result['sessionId']
+        await self.send('Page.enable')
+        if self.network:
+            self.browser.listen(self.session_id, self.network.handle)
+        if lean_mode_enabled() or self.network:
+            await self.send('Network.enable')
+        if lean_mode_enabled():
+            await self.send('Network.setBlockedURLs', {'urls': lean_blocked_urls()})
+    
+    async def collect_network(self):
+        """读取已完成的 JSON 响应内容"""
+        if not self.network:
+            return None
+        for request_id, request in self.network.take_finished():
+            try:
+                body = await self.send('Network.getResponseBody', {'requestId': request_id})
+                self.network.add_body(request, body.get('body', ''), body.get('base64Encoded', False))
+            except CdpError as e:
+                logger.debug(f"读取接口响应失败: {e}")
+        return self.network
+    
+    async def close(self):
+        if self.session_id:
+            self.browser.listen(self.session_id, None)
+        if self.context_id:
+            try:
+                await self.browser.send('Target.disposeBrowserContext', {'browserContextId': self.context_id}, timeout=10)
             except Exception as e:
-                logger.warning(f"第 {attempt + 1} 次检查签到页面时出错: {e}")
-        
-        return False
+                logger.debug(f"关闭浏览器上下文出错: {e}")
+            self.context_id = None
     
-    def find_and_click_checkin_button(self):
-        """查找并点击签到按钮 - 处理已签到状态"""
-        logger.info("查找签到按钮...")
+    async def restore_session(self):
+        """从缓存恢复登录状态（与线程模式共用同一份缓存），成功后可跳过登录流程"""
+        if not self.session_cache:
+            return False
+        # 解密时的密钥派生较慢，放到线程中执行
+        state = await asyncio.to_thread(self.session_cache.load, self.email, self.password)
+        if not state or not state.get('cookies'):
+            return False
+        if not await asyncio.to_thread(LeaflowAutoCheckin.validate_session, state['cookies']):
+            logger.info("缓存的登录状态已失效，需要重新登录")
+            self.session_cache.delete(self.email)
+            return False
         
         try:
-            # 先等待页面可能的重载
-            time.sleep(5)
-            
-            # 使用和单账号成功时相同的选择器
-            checkin_selectors = [
-                "button.checkin-btn",
-                "//button[contains(text(), '立即签到')]",
-                "//button[contains(@class, 'checkin')]",
-                "button[type='submit']",
-                "button[name='checkin']"
-            ]
-            
-            for selector in checkin_selectors:
-                try:
-                    if selector.startswith("//"):
-                        checkin_btn = WebDriverWait(self.driver, 15).until(
-                            EC.presence_of_element_located((By.XPATH, selector))
-                        )
-                    else:
-                        checkin_btn = WebDriverWait(self.driver, 15).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                        )
-                    
-                    if checkin_btn.is_displayed():
-                        # 检查按钮文本，如果包含"已签到"则说明今天已经签到过了
-                        btn_text = checkin_btn.text.strip()
-                        if "已签到" in btn_text:
-                            logger.info("伙计，今日你已经签到过了！")
-                            return "already_checked_in"
-                        
-                        # 检查按钮是否可用
-                        if checkin_btn.is_enabled():
-                            logger.info(f"找到并点击立即签到按钮")
-                            checkin_btn.click()
-                            return True
-                        else:
-                            logger.info("签到按钮不可用，可能已经签到过了")
-                            return "already_checked_in"
-                        
-                except Exception as e:
-                    logger.debug(f"选择器未找到按钮: {e}")
-                    continue
-            
-            logger.error("找不到签到按钮")
-            return False
-                    
-        except Exception as e:
-            logger.error(f"查找签到按钮时出错: {e}")
+            await self.send('Network.setCookies', {'cookies': SessionCache.cookie_params(state['cookies'])})
+            local_storage = state.get('local_storage') or {}
+            if local_storage:
+                await self.send('Page.addScriptToEvaluateOnNewDocument', {
+                    'source': SessionCache.storage_script(local_storage)
+                })
+        except CdpError as e:
+            logger.warning(f"恢复登录状态失败: {e}")
             return False
+        
+        logger.info("已恢复缓存的登录状态，跳过登录")
+        self.session_restored = True
+        return True
     
-    def checkin(self):
+    async def save_session(self):
+        """登录成功后加密保存Cookie和本地存储"""
+        if not self.session_cache:
+            return
+        try:
+            result = await self.send('Network.getCookies', {'urls': [LEAFLOW_BASE_URL, LEAFLOW_CHECKIN_URL]})
+            cookies = [c for c in result.get('cookies', []) if c.get('domain', '').lstrip('.').endswith(LEAFLOW_HOSTNAME)]
+            local_storage = {}
+            if (await self.current_url()).startswith(LEAFLOW_BASE_URL):
+                local_storage = await self.call("return Object.assign({}, window.localStorage);") or {}
+            await asyncio.to_thread(self.session_cache.save, self.email, self.password, {
+                'cookies': cookies,
+                'local_storage': local_storage,
+                'saved_at': time.time()
+            })
+            logger.info("登录状态已缓存")
+        except (CdpError, OSError) as e:
+            logger.warning(f"保存登录状态失败: {e}")
+    
+    async def login(self):
+        """执行登录流程"""
+        logger.info("开始登录流程")
+        await throttle_async()
+        await self.navigate(f"{LEAFLOW_BASE_URL}/login")
+        
+        # 点击页面左上角关闭初始弹窗
+        for event_type in ('mousePressed', 'mouseReleased'):
+            await self.send('Input.dispatchMouseEvent', {'type': event_type, 'x': 10, 'y': 10, 'button': 'left', 'clickCount': 1})
+        await self.page_ready(timeout=3, idle_ms=300)
+        
+        email_selectors = self.selectors.order('login_email', EMAIL_SELECTORS)
+        with self.timeouts.measure('login_email'):
+            selector = await self.until(lambda: self.call(FILL_FIRST_SCRIPT, email_selectors, self.email),
+                                        timeout=self.step_limit('login_email'),
+                                        message="找不到邮箱输入框")
+        self.selectors.record_winner('login_email', email_selectors, selector)
+        
+        with self.timeouts.measure('login_password'):
+            await self.until(lambda: self.call(FILL_FIRST_SCRIPT, [PASSWORD_SELECTOR], self.password),
+                             timeout=self.step_limit('login_password'),
+                             message="找不到密码输入框")
+        
+        button_selectors = self.selectors.order('login_button', LOGIN_BUTTON_SELECTORS)
+        with self.timeouts.measure('login_button'):
+            button = await self.until(lambda: self.call(CLICK_FIRST_SCRIPT, button_selectors, True, None),
+                                      timeout=self.step_limit('login_button'),
+                                      message="找不到登录按钮")
+        self.selectors.record_winner('login_button', button_selectors, button['selector'])
+        
+        async def logged_in():
+            return is_login_url(await self.current_url())
+        with self.timeouts.measure('login_redirect'):
+            await self.until(logged_in, timeout=self.step_limit('login_redirect'),
+                             message="登录超时，无法确认登录状态")
+        logger.info("登录成功")
+    
+    async def checkin(self):
         """执行签到流程"""
         logger.info("跳转到签到页面...")
+        await self.navigate(LEAFLOW_CHECKIN_URL)
         
-        # 跳转到签到页面
-        self.driver.get("https://checkin.leaflow.net")
+        checkin_selectors = self.selectors.order('checkin_button', CHECKIN_BUTTON_SELECTORS)
+        await throttle_async()
+        mark = await self.call(WaitEngine._ACTIVITY_SCRIPT)
+        with self.timeouts.measure('checkin_button'):
+            button = await self.until(lambda: self.call(CLICK_FIRST_SCRIPT, checkin_selectors, True, "已签到"),
+                                      timeout=self.step_limit('checkin_button'),
+                                      message="找不到立即签到按钮")
+        self.selectors.record_winner('checkin_button', checkin_selectors, button['selector'])
         
-        # 等待签到页面加载（最多重试3次，每次等待20秒）
-        if not self.wait_for_checkin_page_loaded(max_retries=3, wait_time=20):
-            raise Exception("签到页面加载失败，无法找到签到相关元素")
+        if not button['clicked']:
+            logger.info("伙计，今日你已经签到过了！")
+            return "今日已签到"
         
-        # 查找并点击立即签到按钮
-        checkin_result = self.find_and_click_checkin_button()
+        logger.info("已点击立即签到按钮")
+        # 等待签到请求返回且页面重新稳定
+        async def settled():
+            return WaitEngine._quiet(await self.call(WaitEngine._ACTIVITY_SCRIPT), 500, since=mark['now'])
+        try:
+            with self.timeouts.measure('checkin_settle'):
+                await self.until(settled, timeout=self.step_limit('checkin_settle'))
+        except TimeoutError:
+            pass
         
-        if checkin_result == "already_checked_in":
-            return "今日已签到"
-        elif checkin_result is True:
-            logger.info("已点击立即签到按钮")
-            time.sleep(5)  # 等待签到结果
-            
-            # 获取签到结果
-            result_message = self.get_checkin_result()
-            return result_message
-        else:
-            raise Exception("找不到立即签到按钮或按钮不可点击")
+        network = await self.collect_network()
+        result = network and network.checkin_result()
+        if result:
+            return result
+        
+        probe = await self.call(DOM_PROBE_SCRIPT, CHECKIN_RESULT_SELECTORS + ["button.checkin-btn"], True, 1)
+        return result_from_probe(probe)
     
-    def get_checkin_result(self):
-        """获取签到结果消息"""
+    async def get_balance(self):
+        """获取当前账号的总余额"""
         try:
-            # 给页面一些时间显示结果
-            time.sleep(3)
-            
-            # 尝试查找各种可能的成功消息元素
-            success_selectors = [
-                ".alert-success",
-                ".success",
-                ".message",
-                "[class*='success']",
-                "[class*='message']",
-                ".modal-content",  # 弹窗内容
-                ".ant-message",    # Ant Design 消息
-                ".el-message",     # Element UI 消息
-                ".toast",          # Toast消息
-                ".notification"    # 通知
-            ]
-            
-            for selector in success_selectors:
-                try:
-                    element = self.driver.find_element(By.CSS_SELECTOR, selector)
-                    if element.is_displayed():
-                        text = element.text.strip()
-                        if text:
-                            return text
-                except:
-                    continue
-            
-            # 如果没有找到特定元素，检查页面文本
-            page_text = self.driver.find_element(By.TAG_NAME, "body").text
-            important_keywords = ["成功", "签到", "获得", "恭喜", "谢谢", "感谢", "完成", "已签到", "连续签到"]
-            
-            for keyword in important_keywords:
-                if keyword in page_text:
-                    # 提取包含关键词的行
-                    lines = page_text.split('\n')
-                    for line in lines:
-                        if keyword in line and len(line.strip()) < 100:  # 避免提取过长的文本
-                            return line.strip()
-            
-            # 检查签到按钮状态变化
-            try:
-                checkin_btn = self.driver.find_element(By.CSS_SELECTOR, "button.checkin-btn")
-                if not checkin_btn.is_enabled() or "已签到" in checkin_btn.text or "disabled" in checkin_btn.get_attribute("class"):
-                    return "今日已签到完成"
-            except:
-                pass
-            
-            return "签到完成，但未找到具体结果消息"
+            logger.info("获取账号余额...")
+            # 签到页面已经请求过的接口中有余额时，不再打开仪表板
+            network = await self.collect_network()
+            balance = network and network.balance()
+            if balance:
+                return f"{balance}元"
             
+            await self.navigate(f"{LEAFLOW_BASE_URL}/dashboard")
+            network = await self.collect_network()
+            balance = network and network.balance()
+            if balance:
+                return f"{balance}元"
+            balance_selectors = self.selectors.order('balance', BALANCE_SELECTORS)
+            probe = await self.call(DOM_PROBE_SCRIPT, balance_selectors, False, 50)
+            balance, selector = balance_from_probe(probe, balance_selectors)
+            self.selectors.record_winner('balance', balance_selectors, selector)
+            if balance:
+                logger.info(f"找到余额: {balance}元")
+                return f"{balance}元"
+            logger.warning("未找到余额信息")
         except Exception as e:
-            return f"获取签到结果时出错: {str(e)}"
+            logger.warning(f"获取余额时出错: {e}")
+        return "未知"
     
-    def run(self):
-        """单个账号执行流程"""
+    async def run(self):
+        """单个账号执行流程，返回值与 LeaflowAutoCheckin.run 相同"""
         try:
-            logger.info(f"开始处理账号")
-            
-            # 登录
-            if self.login():
-                # 签到
-                result = self.checkin()
-                
-                # 获取余额
-                balance = self.get_balance()
-                
-                logger.info(f"签到结果: {result}, 余额: {balance}")
-                return True, result, balance
-            else:
-                raise Exception("登录失败")
-                
+            with metrics.span('account_async', self.account_id):
+                await self.open()
+                # 优先恢复缓存的登录状态，失效时再走完整登录
+                if not await self.restore_session():
+                    await self.login()
+                    await self.save_session()
+                result = await self.checkin()
+                balance = await self.get_balance()
+            logger.info(f"签到结果: {result}, 余额: {balance}")
+            return True, result, balance
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             error_msg = f"自动签到失败: {str(e)}"
             logger.error(error_msg)
+            if self.session_restored and self.session_cache:
+                # 恢复的会话可能已在服务端失效，下次重新登录
+                self.session_cache.delete(self.email)
             return False, error_msg, "未知"
-        
         finally:
-            if self.driver:
-                self.driver.quit()
+            await self.close()
+
+class AccountFile:
+    """从 JSONL/CSV 文件逐行读取账号，支持 Fernet 加密文件和每个账号单独的优先级、代理、超时设置
+    
+    JSONL 每行一个对象，CSV 首行为表头，字段：email、password、priority、proxy、timeout。
+    文件名以 .enc 结尾时按 Fernet 解密（LEAFLOW_ACCOUNTS_KEY），如 accounts.jsonl.enc。
+    """
+    
+    FIELDS = ('email', 'password', 'priority', 'proxy', 'timeout')
+    
+    def __init__(self, path, key=None, window=256):
+        self.path = path
+        self.key = key
+        self.window = window
+        name = path[:-4] if path.endswith('.enc') else path
+        self.format = 'csv' if name.lower().endswith('.csv') else 'jsonl'
+    
+    @classmethod
+    def from_env(cls):
+        path = os.getenv('LEAFLOW_ACCOUNTS_FILE', '').strip()
+        if not path:
+            return None
+        if not os.path.isfile(path):
+            raise ValueError(f"账号文件不存在: {path}")
+        key = os.getenv('LEAFLOW_ACCOUNTS_KEY', '').strip() or None
+        if path.endswith('.enc') and not key:
+            raise ValueError("加密的账号文件需要设置 LEAFLOW_ACCOUNTS_KEY")
+        if path.endswith('.enc') and Fernet is None:
+            raise ValueError("读取加密的账号文件需要安装 cryptography")
+        logger.info(f"从文件读取账号: {path}")
+        return cls(path, key, get_int_env('LEAFLOW_ACCOUNTS_WINDOW', 256))
+    
+    def _open(self):
+        """加密文件整体解密到内存，普通文件逐行读取"""
+        if not self.path.endswith('.enc'):
+            return open(self.path, encoding='utf-8', newline='')
+        with open(self.path, 'rb') as f:
+            try:
+                data = Fernet(self.key.encode('utf-8')).decrypt(f.read().strip())
+            except (InvalidToken, ValueError):
+                raise ValueError("账号文件解密失败，请检查 LEAFLOW_ACCOUNTS_KEY")
+        return io.StringIO(data.decode('utf-8'), newline='')
+    
+    def _records(self):
+        """逐条产出 (行号, 原始记录)，JSON 格式错误的行记为 None"""
+        with self._open() as f:
+            if self.format == 'csv':
+                for line_no, row in enumerate(csv.DictReader(f), 2):
+                    yield line_no, {k.strip(): (v or '').strip() for k, v in row.items() if k}
+                return
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield line_no, record if isinstance(record, dict) else None
+    
+    @staticmethod
+    def priority(record):
+        try:
+            return int((record or {}).get('priority') or 0)
+        except (TypeError, ValueError):
+            return 0
+    
+    @staticmethod
+    def validate(record):
+        """检查单条账号记录，返回账号字典，格式错误时抛出 ValueError"""
+        if record is None:
+            raise ValueError("不是有效的 JSON 对象")
+        email = str(record.get('email') or '').strip()
+        password = str(record.get('password') or '')
+        if not email or not password:
+            raise ValueError("缺少邮箱或密码")
+        if '@' not in email:
+            raise ValueError("邮箱格式错误")
+        
+        account = {'email': email, 'password': password, 'priority': AccountFile.priority(record)}
+        proxy = str(record.get('proxy') or '').strip()
+        if proxy:
+            if '://' not in proxy:
+                raise ValueError("代理地址需要包含协议，如 http://host:port")
+            account['proxy'] = proxy
+        timeout = record.get('timeout')
+        if timeout not in (None, ''):
+            try:
+                account['timeout'] = int(timeout)
+            except (TypeError, ValueError):
+                raise ValueError(f"timeout 不是整数: {timeout}")
+            if account['timeout'] <= 0:
+                raise ValueError(f"timeout 必须为正数: {timeout}")
+        return account
+    
+    def __iter__(self):
+        """按块读取文件，块内按 priority 从高到低排序，取出时再校验"""
+        records = self._records()
+        while True:
+            chunk = list(itertools.islice(records, self.window))
+            if not chunk:
+                return
+            chunk.sort(key=lambda item: -self.priority(item[1]))
+            for line_no, record in chunk:
+                try:
+                    account = self.validate(record)
+                except ValueError as e:
+                    logger.warning(f"账号文件第 {line_no} 行无效，已跳过: {e}")
+                    continue
+                # 记下行号，结果按文件中的顺序汇总，不受块内优先级排序影响
+                account['order'] = line_no
+                yield account
+
+class ResultWriter:
+    """每个账号完成后立即追加一行 JSON 结果，任务中途被终止时已完成的结果不会丢失"""
+    
+    def __init__(self, stream=None, path=None):
+        self.stream = stream
+        self.path = path
+    
+    @classmethod
+    def open(cls, target):
+        if target == '-':
+            return cls(stream=sys.stdout)
+        try:
+            return cls(stream=open(target, 'a', encoding='utf-8'), path=target)
+        except OSError as e:
+            logger.warning(f"无法打开结果输出文件 {target}: {e}")
+            return cls()
+    
+    @classmethod
+    def from_env(cls):
+        """LEAFLOW_RESULTS_JSONL 为文件路径，设为 - 时写到标准输出"""
+        target = os.getenv('LEAFLOW_RESULTS_JSONL', '').strip()
+        return cls.open(target) if target else cls()
+    
+    def write(self, outcome, attempt, final, order=None):
+        """order 为账号在配置中的位置，merge 按它恢复配置顺序"""
+        if not self.stream:
+            return
+        email, success, result, balance = outcome
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'account': account_hash(email),
+            'email': mask_email(email),
+            'success': success,
+            'result': result,
+            'balance': balance,
+            'attempt': attempt,
+            'final': final
+        }
+        if order is not None:
+            record['order'] = order
+        try:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+        except OSError as e:
+            logger.warning(f"写入签到结果失败: {e}")
+    
+    def close(self):
+        if self.path and self.stream:
+            self.stream.close()
+            logger.info(f"签到结果已写入 {self.path}")
+        self.stream = None
+
+class TelegramNotifier:
+    """Telegram 通知 - 按长度上限分段，复用连接，遵守 429 retry_after，在后台线程发送"""
+    
+    # Telegram 单条消息上限 4096 字符
+    MAX_LENGTH = 4096
+    
+    def __init__(self, bot_token, chat_id, max_retries=3, timeout=10):
+        self.url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        self.chat_id = chat_id
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls):
+        """TELEGRAM_BOT_TOKEN 和 TELEGRAM_CHAT_ID 都已设置时创建，否则返回 None"""
+        bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
+        chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
+        return cls(bot_token, chat_id) if bot_token and chat_id else None
+    
+    @classmethod
+    def split_message(cls, blocks, limit=None):
+        """把消息块尽量合并成不超过上限的分段，单个超长块按行或硬切分"""
+        limit = limit or cls.MAX_LENGTH
+        chunks = []
+        current = ""
+        for block in blocks:
+            while len(block) > limit:
+                cut = block.rfind("\n", 0, limit)
+                cut = cut if cut > 0 else limit
+                block_part, block = block[:cut], block[cut:].lstrip("\n")
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(block_part)
+            if len(current) + len(block) > limit:
+                chunks.append(current)
+                current = ""
+            current += block
+        if current.strip():
+            chunks.append(current)
+        return chunks
+    
+    def send(self, text):
+        """同步发送一条消息，网络错误和 5xx 退避重试，429 按 retry_after 等待"""
+        data = {"chat_id": self.chat_id, "text": text, "parse_mode": "HTML"}
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, data=data, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning(f"Telegram请求出错: {e}")
+                time.sleep(2 ** attempt)
+                continue
+            
+            if response.status_code == 200:
+                return True
+            if response.status_code == 429:
+                try:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', 5)
+                except ValueError:
+                    retry_after = 5
+                logger.info(f"Telegram限流，{retry_after} 秒后重试")
+                time.sleep(retry_after)
+                continue
+            if response.status_code >= 500:
+                time.sleep(2 ** attempt)
+                continue
+            
+            logger.error(f"Telegram通知发送失败: {response.text}")
+            return False
+        
+        logger.error("Telegram通知多次重试后仍未发送成功")
+        return False
+    
+    def _run(self):
+        while True:
+            text = self._queue.get()
+            try:
+                if text is None:
+                    return
+                self.send(text)
+            finally:
+                self._queue.task_done()
+    
+    def submit(self, text):
+        """放入后台队列按顺序发送，不阻塞调用方"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='telegram', daemon=True)
+                self._worker.start()
+        self._queue.put(text)
+    
+    def flush(self, timeout):
+        """等待队列中的消息发送完成，最多等待 timeout 秒，返回是否全部发送"""
+        if self._worker is None:
+            return True
+        self._queue.put(None)
+        self._worker.join(timeout)
+        finished = not self._worker.is_alive()
+        if finished:
+            self._worker = None
+        else:
+            logger.warning(f"Telegram通知在 {timeout} 秒内未发送完成，不再等待")
+        return finished
 
 class MultiAccountManager:
     """多账号管理器 - 简化配置版本"""
     
-    def __init__(self):
+    # worker 没有可领取的账号、但其他 worker 仍在处理时的轮询间隔
+    QUEUE_POLL_INTERVAL = 5
+    
+    @classmethod
+    def notifier_only(cls):
+        """merge 和 report 只发送汇总通知：不加载账号，也不创建状态目录、数据库和浏览器相关设置"""
+        manager = cls.__new__(cls)
+        manager.notifier = TelegramNotifier.from_env()
+        return manager
+    
+    def __init__(self, shard=None, accounts=None):
         self.telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
         self.telegram_chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
-        self.accounts = self.load_accounts()
+        self.notifier = TelegramNotifier.from_env()
+        self.concurrency = get_int_env('LEAFLOW_CONCURRENCY', 1)
+        self.use_driver_pool = os.getenv('LEAFLOW_DRIVER_POOL', '1').strip() != '0'
+        self.driver_max_uses = get_int_env('LEAFLOW_DRIVER_MAX_USES', 20)
+        self.driver_pool = None
+        self.memory_governor = MemoryGovernor.from_env(self.concurrency, on_shrink=self.trim_driver_pool)
+        self.profiler = PageProfiler.from_env()
+        self.session_cache = SessionCache.from_env()
+        self.selector_registry = SelectorRegistry.from_env()
+        self.step_timeouts = StepTimeouts.from_env()
+        self.step_timeouts_adaptive = self.step_timeouts.adaptive
+        self.checkin_state = CheckinStateStore.from_env()
+        self.http_fast_path = os.getenv('LEAFLOW_HTTP_FAST_PATH', '1').strip() != '0'
+        self.mode = os.getenv('LEAFLOW_MODE', 'thread').strip().lower()
+        self.account_timeout = get_int_env('LEAFLOW_ACCOUNT_TIMEOUT', 300)
+        self.retry_budget = self.load_retry_budget()
+        self.retry_base_delay = get_int_env('LEAFLOW_RETRY_BASE_DELAY', 10)
+        self.notify_each = os.getenv('LEAFLOW_NOTIFY_EACH', '0').strip() == '1'
+        self.shard = shard
+        self.accounts = self.load_accounts() if accounts is None else accounts
+        self.accounts_read = 0
+    
+    def load_retry_budget(self):
+        """失败账号的最大重试次数，0 表示不重试"""
+        value = os.getenv('LEAFLOW_RETRY_BUDGET', '2').strip()
+        try:
+            return max(0, int(value))
+        except ValueError:
+            logger.warning(f"LEAFLOW_RETRY_BUDGET 格式错误: {value}，使用默认值 2")
+            return 2
     
     def load_accounts(self):
-        """从环境变量加载多账号信息，支持冒号分隔多账号和单账号"""
+        """从环境变量加载多账号信息，支持账号文件、冒号分隔多账号和单账号"""
         accounts = []
         
         logger.info("开始加载账号配置...")
         
+        # 方法0: 账号文件，逐行读取，账号数较多时使用
+        account_file = AccountFile.from_env()
+        if account_file:
+            return account_file
+        
         # 方法1: 冒号分隔多账号格式
         accounts_str = os.getenv('LEAFLOW_ACCOUNTS', '').strip()
         if accounts_str:
@@ -536,14 +3771,31 @@ class MultiAccountManager:
         # 如果所有方法都失败
         logger.error("未找到有效的账号配置")
         logger.error("请检查以下环境变量设置:")
+        logger.error("0. LEAFLOW_ACCOUNTS_FILE: 账号文件 (JSONL/CSV)")
         logger.error("1. LEAFLOW_ACCOUNTS: 冒号分隔多账号 (email1:pass1,email2:pass2)")
         logger.error("2. LEAFLOW_EMAIL 和 LEAFLOW_PASSWORD: 单账号")
         
         raise ValueError("未找到有效的账号配置")
     
+    @staticmethod
+    def format_account_block(email, success, result, balance):
+        """单个账号的通知内容"""
+        masked_email = html.escape(mask_email(email))
+        result = html.escape(str(result))
+        
+        if success:
+            status = "✅"
+            return (f"账号：{masked_email}\n"
+                    f"{status}  {result}！\n"
+                    f"💰  当前总余额：{html.escape(str(balance))}。\n\n")
+        status = "❌"
+        return (f"账号：{masked_email}\n"
+                f"{status}  {result}\n\n")
+    
+    @timed('send_notification')
     def send_notification(self, results):
-        """发送汇总通知到Telegram - 按照指定模板格式"""
-        if not self.telegram_bot_token or not self.telegram_chat_id:
+        """发送汇总通知到Telegram - 按照指定模板格式，超长时分段发送"""
+        if not self.notifier:
             logger.info("Telegram配置未设置，跳过通知")
             return
         
@@ -553,77 +3805,517 @@ class MultiAccountManager:
             total_count = len(results)
             current_date = datetime.now().strftime("%Y/%m/%d")
             
-            message = f"🎁 Leaflow自动签到通知\n"
-            message += f"📊 成功: {success_count}/{total_count}\n"
-            message += f"📅 签到时间：{current_date}\n\n"
-            
-            for email, success, result, balance in results:
-                # 隐藏邮箱部分字符以保护隐私
-                masked_email = email[:3] + "***" + email[email.find("@"):]
-                
-                if success:
-                    status = "✅"
-                    message += f"账号：{masked_email}\n"
-                    message += f"{status}  {result}！\n"
-                    message += f"💰  当前总余额：{balance}。\n\n"
-                else:
-                    status = "❌"
-                    message += f"账号：{masked_email}\n"
-                    message += f"{status}  {result}\n\n"
-            
-            url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
-            data = {
-                "chat_id": self.telegram_chat_id,
-                "text": message,
-                "parse_mode": "HTML"
-            }
+            header = f"🎁 Leaflow自动签到通知\n"
+            header += f"📊 成功: {success_count}/{total_count}\n"
+            header += f"📅 签到时间：{current_date}\n\n"
             
-            response = requests.post(url, data=data, timeout=10)
-            if response.status_code == 200:
-                logger.info("Telegram汇总通知发送成功")
-            else:
-                logger.error(f"Telegram通知发送失败: {response.text}")
+            blocks = [header] + [self.format_account_block(*outcome) for outcome in results]
+            chunks = TelegramNotifier.split_message(blocks)
+            for chunk in chunks:
+                self.notifier.submit(chunk)
+            logger.info(f"Telegram汇总通知已加入发送队列，共 {len(chunks)} 条")
                 
         except Exception as e:
             logger.error(f"发送Telegram通知时出错: {e}")
     
-    def run_all(self):
-        """运行所有账号的签到流程"""
-        logger.info(f"开始执行 {len(self.accounts)} 个账号的签到任务")
+    def wait_for_notifications(self):
+        """退出前等待后台通知发送，最多等待 LEAFLOW_NOTIFY_TIMEOUT 秒"""
+        if self.notifier:
+            self.notifier.flush(get_int_env('LEAFLOW_NOTIFY_TIMEOUT', 30))
+    
+    def trim_driver_pool(self, keep):
+        """内存不足时关闭多余的空闲浏览器"""
+        if self.driver_pool:
+            self.driver_pool.trim(keep)
+    
+    def checked_in_today(self, account):
+        """当天已签到成功的账号直接返回上次的结果，不启动浏览器"""
+        if not self.checkin_state:
+            return None
+        row = self.checkin_state.get(account['email'])
+        if not row:
+            return None
+        result, balance = row
+        logger.info("该账号今日已签到，跳过")
+        return account['email'], True, f"{result}（今日已完成，本次跳过）", balance
+    
+    def remember_result(self, outcome):
+        """记录确认签到成功的账号，供当天重复运行时跳过
         
-        results = []
+        只记录明确的结果（按钮显示已签到、成功消息或签到接口成功响应），
+        “签到完成，但未找到具体结果消息”这类推测的结果不记录，下次运行会重新检查。
+        """
+        email, success, result, balance = outcome
+        if success and not is_confirmed_result(result):
+            logger.info("签到结果未经确认，不记录为今日已签到")
+        elif success and self.checkin_state:
+            try:
+                self.checkin_state.record(email, result, balance)
+            except sqlite3.Error as e:
+                logger.warning(f"保存签到记录失败: {e}")
+        return outcome
+    
+    def run_account(self, account):
+        """处理单个账号，已签到则跳过，优先走HTTP快速通道，失败时使用独立的浏览器实例"""
+        skipped = self.checked_in_today(account)
+        if skipped:
+            return skipped
+        return self.remember_result(self.process_account(account))
+    
+    def process_account(self, account):
+        """在看门狗下执行单个账号的签到，超过 LEAFLOW_ACCOUNT_TIMEOUT 后结束浏览器进程并记为超时"""
+        with watchdog.guard(self.account_timeout, account_hash(account['email'])) as entry:
+            outcome = self.checkin_account(account)
+        if entry.expired:
+            result = f"自动签到失败: 超过 {self.account_timeout} 秒未完成"
+            logger.error(result)
+            return account['email'], False, result, "未知"
+        return outcome
+    
+    def checkin_account(self, account):
+        """执行单个账号的签到"""
+        if self.http_fast_path:
+            try:
+                client = HttpCheckinClient(account['email'], account['password'],
+                                           timeout=account.get('timeout', 15), proxy=account.get('proxy'),
+                                           session_cache=self.session_cache)
+                success, result, balance = client.run()
+                return account['email'], success, result, balance
+            except HttpFallback as e:
+                logger.info(f"HTTP快速通道不可用，回退到浏览器流程: {e}")
+            except Exception as e:
+                logger.warning(f"HTTP快速通道出错，回退到浏览器流程: {e}")
         
-        for i, account in enumerate(self.accounts, 1):
-            logger.info(f"处理第 {i}/{len(self.accounts)} 个账号")
+        try:
+            # 浏览器会话数受内存控制，超出上限时在这里排队
+            with self.memory_governor.session(account_hash(account['email'])):
+                auto_checkin = LeaflowAutoCheckin(
+                    account['email'], account['password'],
+                    driver_pool=self.driver_pool,
+                    session_cache=self.session_cache,
+                    selector_registry=self.selector_registry,
+                    proxy=account.get('proxy'),
+                    step_timeout=account.get('timeout'),
+                    step_timeouts=self.step_timeouts,
+                    memory_governor=self.memory_governor,
+                    profiler=self.profiler
+                )
+                success, result, balance = auto_checkin.run()
+            return account['email'], success, result, balance
+        except Exception as e:
+            error_msg = f"处理账号时发生异常: {str(e)}"
+            logger.error(error_msg)
+            return account['email'], False, error_msg, "未知"
+    
+    async def run_account_async(self, get_browser, semaphore, account):
+        """asyncio 模式下处理单个账号，已签到则跳过"""
+        skipped = self.checked_in_today(account)
+        if skipped:
+            return skipped
+        return self.remember_result(await self.process_account_async(get_browser, semaphore, account))
+    
+    async def process_account_async(self, get_browser, semaphore, account):
+        """asyncio 模式下执行单个账号的签到，超时后取消该账号的任务"""
+        async with semaphore:
+            if self.http_fast_path:
+                try:
+                    client = HttpCheckinClient(account['email'], account['password'],
+                                               timeout=account.get('timeout', 15), proxy=account.get('proxy'),
+                                               session_cache=self.session_cache)
+                    success, result, balance = await asyncio.to_thread(client.run)
+                    return account['email'], success, result, balance
+                except HttpFallback as e:
+                    logger.info(f"HTTP快速通道不可用，回退到浏览器流程: {e}")
+                except Exception as e:
+                    logger.warning(f"HTTP快速通道出错，回退到浏览器流程: {e}")
             
             try:
-                auto_checkin = LeaflowAutoCheckin(account['email'], account['password'])
-                success, result, balance = auto_checkin.run()
-                results.append((account['email'], success, result, balance))
-                
-                # 在账号之间添加间隔，避免请求过于频繁
-                if i < len(self.accounts):
-                    wait_time = 5
-                    logger.info(f"等待{wait_time}秒后处理下一个账号...")
-                    time.sleep(wait_time)
-                    
+                browser = await get_browser()
             except Exception as e:
                 error_msg = f"处理账号时发生异常: {str(e)}"
                 logger.error(error_msg)
-                results.append((account['email'], False, error_msg, "未知"))
+                return account['email'], False, error_msg, "未知"
+            
+            checkin = AsyncCdpCheckin(browser, account['email'], account['password'],
+                                      selector_registry=self.selector_registry,
+                                      step_timeout=account.get('timeout'),
+                                      proxy=account.get('proxy'),
+                                      step_timeouts=self.step_timeouts,
+                                      session_cache=self.session_cache)
+            try:
+                success, result, balance = await asyncio.wait_for(checkin.run(), self.account_timeout)
+            except asyncio.TimeoutError:
+                success, result, balance = False, f"自动签到失败: 超过 {self.account_timeout} 秒未完成", "未知"
+                logger.error(result)
+            return account['email'], success, result, balance
+    
+    async def run_all_async(self, items, on_result=None):
+        """在一个事件循环中通过 CDP 并发处理 (序号, 账号)，每完成一个账号调用 on_result(序号, 账号, 结果)"""
+        browser = None
+        launch_error = None
+        lock = asyncio.Lock()
+        
+        async def get_browser():
+            # 第一个需要浏览器的账号才启动 Chrome，HTTP快速通道全部成功时不启动
+            nonlocal browser, launch_error
+            async with lock:
+                if browser is None and launch_error is None:
+                    try:
+                        browser = await CdpBrowser.launch()
+                    except Exception as e:
+                        launch_error = e
+                if launch_error:
+                    raise launch_error
+                return browser
+        
+        async def run_one(key, account):
+            outcome = await self.run_account_async(get_browser, semaphore, account)
+            if on_result:
+                on_result(key, account, outcome)
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        items = iter(items)
+        running = set()
+        try:
+            # 和线程模式一样只预取少量账号，完成一个再读取下一个，账号文件不会整个读入内存
+            while True:
+                for key, account in itertools.islice(items, self.concurrency * 2 - len(running)):
+                    running.add(asyncio.create_task(run_one(key, account)))
+                if not running:
+                    return
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            if browser:
+                await browser.close()
+    
+    def iter_async_batch(self, items):
+        """在后台线程运行事件循环，主线程按完成顺序取出结果"""
+        done = queue.Queue()
+        errors = []
+        
+        def runner():
+            try:
+                asyncio.run(self.run_all_async(items, lambda key, account, outcome: done.put((key, account, outcome))))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done.put(None)
+        
+        thread = threading.Thread(target=runner, name='async-loop', daemon=True)
+        thread.start()
+        while True:
+            item = done.get()
+            if item is None:
+                break
+            yield item
+        thread.join()
+        if errors:
+            raise errors[0]
+    
+    def iter_batch(self, items):
+        """按当前执行模式处理一批 (序号, 账号)，每完成一个账号就产出 (序号, 账号, 结果)"""
+        if self.mode == 'async':
+            yield from self.iter_async_batch(items)
+            return
+        
+        if self.concurrency > 1:
+            # 有界线程池并发处理，只预取少量账号，按完成顺序产出结果
+            items = iter(items)
+            running = {}
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='account') as executor:
+                while True:
+                    for key, account in itertools.islice(items, self.concurrency * 2 - len(running)):
+                        running[executor.submit(self.run_account, account)] = (key, account)
+                    if not running:
+                        return
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key, account = running.pop(future)
+                        yield key, account, future.result()
+        
+        # 请求频率由全局令牌桶控制，账号之间不再固定等待
+        for i, (key, account) in enumerate(items, 1):
+            logger.info(f"处理第 {i} 个账号")
+            yield key, account, self.run_account(account)
+    
+    def retry_delay(self, attempt):
+        """指数退避加随机抖动"""
+        base = self.retry_base_delay * (2 ** (attempt - 1))
+        return base + random.uniform(0, self.retry_base_delay)
+    
+    def iter_attempts(self, pending):
+        """处理 pending 中的 (序号, 账号)，失败的账号退避后重新排队，直到成功或用完重试次数"""
+        for attempt in range(self.retry_budget + 1):
+            if attempt:
+                delay = self.retry_delay(attempt)
+                logger.info(f"{len(pending)} 个账号失败，{delay:.1f} 秒后进行第 {attempt}/{self.retry_budget} 次重试")
+                time.sleep(delay)
+            
+            # 自适应超时可能过紧，重试时使用固定超时
+            self.step_timeouts.adaptive = self.step_timeouts_adaptive and attempt == 0
+            failed = []
+            with metrics.span('retry_round', attempt=attempt, accounts=len(pending)) if attempt else contextlib.nullcontext():
+                for key, account, outcome in self.iter_batch(pending):
+                    success = outcome[1]
+                    if not success:
+                        failed.append((key, account))
+                    yield key, outcome, attempt, success or attempt == self.retry_budget
+            
+            if not failed:
+                break
+            pending = sorted(failed, key=lambda item: item[0])
+    
+    def iter_accounts(self):
+        """分片运行时只产出属于当前分片的账号，每个账号带有它在全部配置中的位置 order"""
+        self.accounts_read = 0
+        for account in self.accounts:
+            self.accounts_read += 1
+            account.setdefault('order', self.accounts_read)
+            if not self.shard or shard_of(account['email'], self.shard[1]) == self.shard[0]:
+                yield account
+    
+    def stream(self):
+        """逐个产出每个账号每次尝试的结果 (序号, 结果, 尝试次数, 是否为最终结果)，序号为账号在配置中的位置"""
+        with self.running():
+            yield from self.iter_attempts((account['order'], account) for account in self.iter_accounts())
+    
+    @contextlib.contextmanager
+    def running(self):
+        """运行期间共用的浏览器池，结束时保存各项统计并关闭"""
+        if self.use_driver_pool and self.mode != 'async':
+            self.driver_pool = DriverPool(self.concurrency, self.driver_max_uses)
+        
+        try:
+            yield
+        finally:
+            if self.driver_pool:
+                self.driver_pool.close()
+                self.driver_pool = None
+            self.selector_registry.save()
+            self.step_timeouts.save()
+            self.step_timeouts.report()
+            if self.checkin_state:
+                self.checkin_state.close()
+                self.checkin_state = None
+    
+    @staticmethod
+    def load_shard_results(paths):
+        """读取各分片的结果文件，按账号在配置中的位置排序
+        
+        结果文件是追加写入的，可能保留以前运行的记录：每个账号取写入时间最新的一条，
+        同一秒内写入的再取尝试次数最大的一条。
+        """
+        latest = {}
+        for path in paths:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    for line_no, line in enumerate(f, 1):
+                        try:
+                            record = json.loads(line)
+                            key = record['account']
+                            newest = (record.get('time', ''), record['attempt'])
+                            if key not in latest or newest >= (latest[key].get('time', ''), latest[key]['attempt']):
+                                latest[key] = record
+                        except (ValueError, KeyError, TypeError):
+                            logger.warning(f"{path} 第 {line_no} 行无效，已跳过")
+            except OSError as e:
+                logger.warning(f"读取分片结果失败: {e}")
+        # 旧版本写出的记录没有 order，排在最后并保持读取顺序
+        records = sorted(latest.values(), key=lambda r: (r.get('order') is None, r.get('order') or 0))
+        return [(r['email'], r['success'], r['result'], r['balance']) for r in records]
+    
+    def merge(self, paths):
+        """合并各分片的结果，发送一条汇总通知"""
+        if not paths:
+            raise ValueError("没有找到分片结果文件")
+        logger.info(f"合并 {len(paths)} 个分片结果文件")
+        results = self.load_shard_results(paths)
+        if not results:
+            raise ValueError("分片结果文件中没有有效的签到结果")
         
-        # 发送汇总通知
         self.send_notification(results)
+        success_count = sum(1 for _, success, _, _ in results if success)
+        return success_count == len(results), results
+    
+    def enqueue(self, work_queue):
+        """生产者：把账号写入工作队列"""
+        count = work_queue.enqueue(self.iter_accounts())
+        logger.info(f"已向工作队列 {work_queue.path} 写入 {count} 个账号")
+        return count
+    
+    def work(self, work_queue, lease_seconds):
+        """worker：并发领取队列中的账号并写回结果，队列中的账号全部完成后退出"""
+        known = AccountIndex(self.iter_accounts, get_int_env('LEAFLOW_ACCOUNTS_WINDOW', 256))
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        max_attempts = self.retry_budget + 1
+        writer = ResultWriter.from_env()
+        write_lock = threading.Lock()
+        if self.mode == 'async':
+            logger.warning("worker 不支持 asyncio 模式，使用线程模式处理队列")
+        logger.info(f"worker {prefix} 开始处理工作队列 {work_queue.path}，并发数: {self.concurrency}")
+        
+        # 处理中的租约定期续期：排队等待内存名额或签到较慢时，其他 worker 不会重复领取同一个账号
+        leases = {}
+        leases_lock = threading.Lock()
+        stopped = threading.Event()
+        
+        def heartbeat():
+            while not stopped.wait(max(1, lease_seconds / 3)):
+                with leases_lock:
+                    held = list(leases.items())
+                for job_id, owner in held:
+                    if not work_queue.renew(job_id, owner, lease_seconds):
+                        logger.warning(f"任务 {job_id} 的租约续期失败，已被其他 worker 接手")
+        
+        def work_loop(index):
+            owner = f"{prefix}:{index}"
+            skipped = set()
+            processed = 0
+            while True:
+                job = work_queue.lease(owner, lease_seconds, max_attempts, exclude=skipped)
+                if job is None:
+                    if not work_queue.has_work(exclude=skipped):
+                        return processed
+                    time.sleep(self.QUEUE_POLL_INTERVAL)
+                    continue
+                
+                job_id, key, attempt = job
+                account = known.get(key)
+                if account is None:
+                    # 本机没有这个账号的配置，留给其他 worker
+                    work_queue.release(job_id, owner)
+                    skipped.add(job_id)
+                    continue
+                
+                with leases_lock:
+                    leases[job_id] = owner
+                try:
+                    outcome = self.run_account(account)
+                finally:
+                    with leases_lock:
+                        leases.pop(job_id, None)
+                final = outcome[1] or attempt >= max_attempts
+                work_queue.complete(job_id, owner, outcome, None if final else time.time() + self.retry_delay(attempt))
+                with write_lock:
+                    writer.write(outcome, attempt - 1, final, order=account.get('order'))
+                processed += 1
+        
+        renewer = threading.Thread(target=heartbeat, name='lease-heartbeat', daemon=True)
+        renewer.start()
+        try:
+            with self.running():
+                with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='worker') as executor:
+                    processed = sum(executor.map(work_loop, range(self.concurrency)))
+        finally:
+            stopped.set()
+            writer.close()
+        
+        page_stats.report()
+        self.memory_governor.report()
+        metrics.report()
+        logger.info(f"worker {prefix} 处理了 {processed} 次账号签到，队列已无待处理账号")
+        return processed
+    
+    def queue_report(self, work_queue):
+        """汇总工作队列中的结果并发送通知"""
+        counts = work_queue.counts()
+        logger.info("工作队列状态: " + ", ".join(f"{status} {count}" for status, count in sorted(counts.items())))
+        unfinished = sum(count for status, count in counts.items() if status != 'done')
+        if unfinished:
+            logger.warning(f"仍有 {unfinished} 个账号未完成")
+        
+        results = work_queue.results()
+        if not results:
+            raise ValueError("工作队列中没有已完成的账号")
+        self.send_notification(results)
+        success_count = sum(1 for _, success, _, _ in results if success)
+        return success_count == len(results) and not unfinished, results
+    
+    def run_all(self):
+        """运行所有账号的签到流程，每个账号完成后立即输出结果"""
+        logger.info(f"开始执行签到任务，并发数: {self.concurrency}")
+        
+        writer = ResultWriter.from_env()
+        if self.shard:
+            index, total = self.shard
+            logger.info(f"分片运行: 第 {index}/{total} 片")
+            if not writer.stream:
+                writer = ResultWriter.open(f"leaflow-results-{index}-of-{total}.jsonl")
+        results = {}
+        try:
+            for index, outcome, attempt, final in self.stream():
+                results[index] = outcome
+                writer.write(outcome, attempt, final, order=index)
+                if final and self.notify_each and self.notifier:
+                    self.notifier.submit(self.format_account_block(*outcome))
+        finally:
+            writer.close()
+        results = [results[key] for key in sorted(results)]
+        if not results:
+            if self.accounts_read:
+                logger.info("当前分片没有分到账号")
+                return True, results
+            raise ValueError("没有可处理的有效账号")
+        
+        page_stats.report()
+        self.memory_governor.report()
+        
+        # 发送汇总通知，分片运行时由 merge 合并后统一发送
+        if self.shard:
+            logger.info("分片运行，汇总通知由 merge 命令统一发送")
+        else:
+            self.send_notification(results)
+        metrics.report()
         
         # 返回总体结果
         success_count = sum(1 for _, success, _, _ in results if success)
-        return success_count == len(self.accounts), results
+        return success_count == len(results), results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Leaflow 多账号自动签到")
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help="只处理按邮箱哈希分到第 i 片（共 N 片）的账号，结果写入 leaflow-results-i-of-N.jsonl")
+    commands = parser.add_subparsers(dest='command')
+    merge = commands.add_parser('merge', help="合并各分片的结果文件并发送汇总通知")
+    merge.add_argument('files', nargs='+', help="分片结果文件，支持通配符")
+    
+    queue_options = argparse.ArgumentParser(add_help=False)
+    queue_options.add_argument('--queue', metavar='PATH', help="工作队列数据库（默认 LEAFLOW_QUEUE_DB 或状态目录中的 queue.db）")
+    commands.add_parser('enqueue', parents=[queue_options], help="把账号写入工作队列")
+    worker = commands.add_parser('worker', parents=[queue_options], help="从工作队列领取账号签到，队列处理完后退出")
+    worker.add_argument('--lease', type=int, metavar='SECONDS',
+                        help="单个账号的租约时长，处理中每隔三分之一租约续期一次，"
+                             "worker 退出后超时未写回的账号会被重新领取（默认 LEAFLOW_ACCOUNT_TIMEOUT + 60）")
+    commands.add_parser('report', parents=[queue_options], help="汇总工作队列中的结果并发送通知")
+    return parser.parse_args(argv)
 
 def main():
     """主函数"""
+    args = parse_args()
     try:
-        manager = MultiAccountManager()
-        overall_success, detailed_results = manager.run_all()
+        if args.command == 'merge':
+            paths = sorted({path for pattern in args.files for path in (glob.glob(pattern) or [pattern])})
+            manager = MultiAccountManager.notifier_only()
+            overall_success, detailed_results = manager.merge(paths)
+        elif args.command == 'enqueue':
+            MultiAccountManager(shard=args.shard).enqueue(WorkQueue.from_env(args.queue))
+            exit(0)
+        elif args.command == 'worker':
+            manager = MultiAccountManager(shard=args.shard)
+            manager.work(WorkQueue.from_env(args.queue), args.lease or manager.account_timeout + 60)
+            manager.wait_for_notifications()
+            exit(0)
+        elif args.command == 'report':
+            manager = MultiAccountManager.notifier_only()
+            overall_success, detailed_results = manager.queue_report(WorkQueue.from_env(args.queue))
+        else:
+            manager = MultiAccountManager(shard=args.shard)
+            overall_success, detailed_results = manager.run_all()
+        manager.wait_for_notifications()
         
         if overall_success:
             logger.info("✅ 所有账号签到成功")
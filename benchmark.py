@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Leaflow 签到离线性能测试
+在本地启动一个模拟 Leaflow 的站点（登录页、弹窗、仪表板余额、签到页），
+把 automatic.py 指向该站点，统计 1/10/100 个账号时的单账号耗时、吞吐量和峰值内存。
+每个账号数在单独的子进程中运行，内存峰值只反映该轮。
+
+用法：
+python benchmark.py                          # HTTP快速通道，账号数 1,10,100
+python benchmark.py --mode browser --sizes 1,10 --concurrency 4
+python benchmark.py --mode async --sizes 10,100 --concurrency 20
+python benchmark.py --latency-ms 200 --failure-rate 0.1 --json bench.json
+python benchmark.py --mode startup --rounds 5     # 冷启动：导入到第一次导航完成的耗时，对比启动缓存开启前后
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+import threading
+import tracemalloc
+from datetime import date
+from http import cookies
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+logger = logging.getLogger("benchmark")
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><meta name="csrf-token" content="{token}"><title>登录 - Leaflow</title></head>
+<body>
+<div id="popup" onclick="this.remove()" style="position:fixed;inset:0;background:rgba(0,0,0,.5)">
+  <div style="margin:20% auto;width:300px;background:#fff">欢迎使用 Leaflow，点击任意位置关闭</div>
+</div>
+<form method="post" action="/login">
+  <input type="hidden" name="_token" value="{token}">
+  <input type="text" name="email" placeholder="邮箱">
+  <input type="password" name="password" placeholder="密码">
+  <button type="submit">登录</button>
+</form>
+</body></html>"""
+
+DASHBOARD_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>仪表板 - Leaflow</title></head>
+<body>
+<nav><button class="dollar"><span class="font-medium">¥{balance:.2f}</span></button></nav>
+<main><h1>工作空间</h1></main>
+</body></html>"""
+
+CHECKIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>每日签到</title></head>
+<body>
+<h1>每日签到</h1>
+<form method="post" action="">
+  <input type="hidden" name="_token" value="{token}">
+  {button}
+</form>
+{message}
+</body></html>"""
+
+class MockLeaflowState:
+    """模拟站点的账号、会话和签到状态"""
+
+    def __init__(self, latency_ms=0, failure_rate=0.0, reward=0.5):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.reward = reward
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.balances = {}
+        self.checked_in = set()
+        self.requests = 0
+        self.failures = 0
+
+    def new_session(self, email):
+        token = os.urandom(16).hex()
+        with self.lock:
+            self.sessions[token] = email
+            self.balances.setdefault(email, 10.0)
+        return token
+
+class MockLeaflowHandler(BaseHTTPRequestHandler):
+    """模拟 leaflow.net 和 checkin.leaflow.net（签到页挂在 /checkin/ 路径下）"""
+
+    state = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("mock: " + format, *args)
+
+    def _prepare(self):
+        """注入延迟和随机故障，返回 False 表示已响应故障"""
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.latency_ms:
+            time.sleep(self.state.latency_ms / 1000.0)
+        if self.state.failure_rate and random.random() < self.state.failure_rate:
+            with self.state.lock:
+                self.state.failures += 1
+            self._send(503, "<html><body>Service Unavailable</body></html>")
+            return False
+        return True
+
+    def _session_email(self):
+        jar = cookies.SimpleCookie(self.headers.get("Cookie", ""))
+        token = jar["leaflow_session"].value if "leaflow_session" in jar else None
+        return self.state.sessions.get(token)
+
+    def _send(self, status, body, headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _redirect(self, location, headers=None):
+        headers = dict(headers or {})
+        headers["Location"] = location
+        self._send(302, "", headers)
+
+    def _form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8")
+        return {key: values[0] for key, values in parse_qs(body).items()}
+
+    def do_GET(self):
+        if not self._prepare():
+            return
+        path = self.path.split("?", 1)[0]
+        email = self._session_email()
+
+        if path in ("/", "/login"):
+            self._send(200, LOGIN_PAGE.format(token=os.urandom(8).hex()))
+        elif path == "/dashboard":
+            if not email:
+                return self._redirect("/login")
+            self._send(200, DASHBOARD_PAGE.format(balance=self.state.balances[email]))
+        elif path.startswith("/checkin"):
+            if not email:
+                return self._redirect("/login")
+            self._send(200, self._checkin_page(email))
+        else:
+            self._send(404, "<html><body>Not Found</body></html>")
+
+    def do_POST(self):
+        if not self._prepare():
+            return
+        path = self.path.split("?", 1)[0]
+        form = self._form()
+
+        if path == "/login":
+            email = form.get("email", "").strip()
+            if not email or not form.get("password"):
+                return self._redirect("/login")
+            token = self.state.new_session(email)
+            self._redirect("/dashboard", {"Set-Cookie": f"leaflow_session={token}; Path=/; HttpOnly"})
+        elif path.startswith("/checkin"):
+            email = self._session_email()
+            if not email:
+                return self._redirect("/login")
+            with self.state.lock:
+                first_time = email not in self.state.checked_in
+                if first_time:
+                    self.state.checked_in.add(email)
+                    self.state.balances[email] += self.state.reward
+            message = f"签到成功，获得 {self.state.reward} 元" if first_time else "今日已签到"
+            self._send(200, self._checkin_page(email, message))
+        else:
+            self._send(404, "<html><body>Not Found</body></html>")
+
+    def _checkin_page(self, email, message=""):
+        if email in self.state.checked_in:
+            button = '<button class="checkin-btn" type="button" disabled>已签到</button>'
+        else:
+            button = '<button class="checkin-btn" type="submit">立即签到</button>'
+        if message:
+            message = f'<div class="alert-success">{message}</div>'
+        return CHECKIN_PAGE.format(token=os.urandom(8).hex(), button=button, message=message)
+
+def start_mock_site(state):
+    """在随机端口启动模拟站点，返回 (server, base_url)"""
+    MockLeaflowHandler.state = state
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockLeaflowHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+class PeakRssSampler:
+    """在后台线程按固定间隔采样本进程和子进程（Chrome/chromedriver）当前的常驻内存，记录本轮的峰值。
+    ru_maxrss 是整个进程生命周期的峰值，连续测多个账号数时只增不减，不能用来比较各轮"""
+
+    def __init__(self, automatic, interval=0.05):
+        self.automatic = automatic
+        self.interval = interval
+        self.own_peak = 0.0
+        self.children_peak = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def sample(self):
+        pid = os.getpid()
+        own = own_rss_mb(self.automatic)
+        total = self.automatic.process_tree_rss_mb(pid)
+        self.own_peak = max(self.own_peak, own)
+        self.children_peak = max(self.children_peak, total - own)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+        self.sample()
+
+def own_rss_mb(automatic):
+    """本进程当前的常驻内存（MB）"""
+    if automatic.psutil:
+        return automatic.psutil.Process().memory_info().rss / 1024 / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, IndexError, ValueError):
+        # 没有 psutil 和 /proc 时退回生命周期峰值（Linux 单位 KB，macOS 单位字节）
+        divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+
+def run_size(automatic, size, args):
+    """用 size 个模拟账号跑一轮，返回统计结果"""
+    state = MockLeaflowState(args.latency_ms, args.failure_rate)
+    server, base_url = start_mock_site(state)
+    # 每轮使用独立的状态目录，不读写真实的缓存、统计和签到记录
+    os.environ["LEAFLOW_STATE_DIR"] = tempfile.mkdtemp(prefix="leaflow-bench-")
+    try:
+        automatic.LEAFLOW_BASE_URL = base_url
+        automatic.LEAFLOW_CHECKIN_URL = f"{base_url}/checkin"
+        automatic.LEAFLOW_HOSTNAME = "127.0.0.1"
+        automatic.LEAFLOW_ORIGINS = [base_url]
+        automatic.metrics = automatic.RunMetrics()
+        automatic.page_stats = automatic.PageLoadStats()
+
+        os.environ["LEAFLOW_ACCOUNTS"] = ",".join(f"bench{i}@example.com:password{i}" for i in range(size))
+        manager = automatic.MultiAccountManager()
+
+        latencies = []
+        latency_lock = threading.Lock()
+        run_account = manager.run_account
+        run_account_async = manager.run_account_async
+
+        def timed_run_account(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return run_account(*args, **kwargs)
+            finally:
+                with latency_lock:
+                    latencies.append(time.perf_counter() - start)
+
+        async def timed_run_account_async(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await run_account_async(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        manager.run_account = timed_run_account
+        manager.run_account_async = timed_run_account_async
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        with PeakRssSampler(automatic) as rss:
+            _, results = manager.run_all()
+        wall = time.perf_counter() - start
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    latencies.sort()
+    success = sum(1 for _, ok, _, _ in results if ok)
+    return {
+        "accounts": size,
+        "success": success,
+        "wall_s": round(wall, 3),
+        "throughput_per_min": round(size / wall * 60, 1) if wall else None,
+        "latency_p50_s": round(automatic.RunMetrics.percentile(latencies, 50), 3),
+        "latency_p95_s": round(automatic.RunMetrics.percentile(latencies, 95), 3),
+        "latency_max_s": round(latencies[-1], 3),
+        "python_heap_peak_mb": round(python_peak / 1024 / 1024, 2),
+        "peak_rss_mb": round(rss.own_peak, 1),
+        "peak_child_rss_mb": round(rss.children_peak, 1),
+        "server_requests": state.requests,
+        "injected_failures": state.failures,
+    }
+
+def run_size_isolated(size, args):
+    """在新的子进程中跑一个账号数，内存峰值只反映这一轮，不受前面各轮的影响"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--sizes", str(size), "--mode", args.mode,
+               "--concurrency", str(args.concurrency), "--latency-ms", str(args.latency_ms),
+               "--failure-rate", str(args.failure_rate), "--rate-limit", str(args.rate_limit),
+               "--retry-budget", str(args.retry_budget), "--seed", str(args.seed)]
+    if args.verbose:
+        command.append("-v")
+    output = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        raise SystemExit(f"[{args.mode}] 账号 {size} 的子进程失败，退出码 {output.returncode}")
+    return json.loads(lines[-1])
+
+# 在子进程中测量一次冷启动：导入 automatic、启动浏览器、打开登录页
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+import automatic
+if os.environ.get("BENCH_EAGER_SELENIUM") == "1":
+    automatic.load_selenium()
+report = {"import_ms": (time.perf_counter() - start) * 1000}
+try:
+    driver = automatic.create_chrome_driver()
+    report["launch_ms"] = (time.perf_counter() - start) * 1000 - report["import_ms"]
+    navigate = time.perf_counter()
+    driver.get(sys.argv[1])
+    report["navigate_ms"] = (time.perf_counter() - navigate) * 1000
+    report["first_navigation_ms"] = (time.perf_counter() - start) * 1000
+    automatic.quit_driver(driver)
+except Exception as e:
+    report["error"] = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+print(json.dumps(report))
+"""
+
+# before: 启动时导入 Selenium，每次重新查找驱动并使用空配置；after: 默认的启动缓存
+STARTUP_VARIANTS = [
+    ("before", {"BENCH_EAGER_SELENIUM": "1", "LEAFLOW_DRIVER_CACHE": "0", "LEAFLOW_PROFILE_TEMPLATE": "0"}),
+    ("after", {"BENCH_EAGER_SELENIUM": "0", "LEAFLOW_DRIVER_CACHE": "1", "LEAFLOW_PROFILE_TEMPLATE": "1"}),
+]
+
+def run_startup(args):
+    """分别以关闭和开启启动缓存的配置，多次冷启动子进程，统计导入和首次导航耗时"""
+    state = MockLeaflowState(args.latency_ms, args.failure_rate)
+    server, base_url = start_mock_site(state)
+    here = os.path.dirname(os.path.abspath(__file__))
+    reports = []
+    try:
+        for variant, overrides in STARTUP_VARIANTS:
+            # 同一配置的各轮共用状态目录，第一轮生成缓存，之后各轮复用
+            env = dict(os.environ, LEAFLOW_STATE_DIR=tempfile.mkdtemp(prefix="leaflow-bench-"),
+                       LEAFLOW_BASE_URL=base_url, LEAFLOW_CHECKIN_URL=f"{base_url}/checkin",
+                       PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])),
+                       **overrides)
+            rounds = []
+            for _ in range(args.rounds):
+                output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, f"{base_url}/login"], env=env,
+                                        cwd=here, capture_output=True, text=True, timeout=300)
+                lines = output.stdout.strip().splitlines()
+                if output.returncode != 0 or not lines:
+                    raise SystemExit(f"[startup] 子进程失败: {output.stderr.strip()[-500:]}")
+                rounds.append(json.loads(lines[-1]))
+
+            # 第一轮包含生成缓存和配置模板的耗时，单独列出；其余各轮取中位数
+            warm = rounds[1:] or rounds
+            report = {"variant": variant, "rounds": rounds, "first_round": rounds[0]}
+            for key in ("import_ms", "launch_ms", "navigate_ms", "first_navigation_ms"):
+                values = [r[key] for r in warm if key in r]
+                if values:
+                    report[f"{key}_p50"] = round(statistics.median(values), 1)
+            reports.append(report)
+
+            line = f"[startup] {variant:<6}: 导入 {report['import_ms_p50']}ms"
+            if "first_navigation_ms_p50" in report:
+                line += (f", 启动浏览器 {report['launch_ms_p50']}ms, 打开登录页 {report['navigate_ms_p50']}ms, "
+                         f"首次导航 {report['first_navigation_ms_p50']}ms "
+                         f"(第一轮 {round(rounds[0].get('first_navigation_ms', 0), 1)}ms)")
+            else:
+                line += f", 无法启动浏览器: {rounds[0].get('error')}"
+            print(line)
+    finally:
+        server.shutdown()
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description="Leaflow 签到离线性能测试")
+    parser.add_argument("--sizes", default="1,10,100", help="账号数量，逗号分隔（默认 1,10,100）")
+    parser.add_argument("--mode", choices=["http", "browser", "async", "startup"], default="http",
+                        help="http: HTTP快速通道；browser: 关闭快速通道，走 Selenium 流程；"
+                             "async: 关闭快速通道，走 asyncio + CDP 流程；"
+                             "startup: 对比启动缓存开启前后的冷启动耗时（后三者需要本地 Chrome）")
+    parser.add_argument("--rounds", type=int, default=3, help="startup 模式下每种配置的冷启动次数（默认 3）")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("LEAFLOW_CONCURRENCY", "4")))
+    parser.add_argument("--latency-ms", type=int, default=0, help="每个请求注入的延迟")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="随机返回 503 的比例")
+    parser.add_argument("--rate-limit", type=float, default=0, help="LEAFLOW_RATE_LIMIT，默认 0 不限速")
+    parser.add_argument("--retry-budget", type=int, default=0, help="LEAFLOW_RETRY_BUDGET，默认 0 不重试")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    os.environ["LEAFLOW_CONCURRENCY"] = str(args.concurrency)
+    os.environ["LEAFLOW_RATE_LIMIT"] = str(args.rate_limit)
+    os.environ["LEAFLOW_RETRY_BUDGET"] = str(args.retry_budget)
+    os.environ["LEAFLOW_RETRY_BASE_DELAY"] = "1"
+    os.environ["LEAFLOW_HTTP_FAST_PATH"] = "1" if args.mode == "http" else "0"
+    os.environ["LEAFLOW_MODE"] = "async" if args.mode == "async" else "thread"
+    for name in ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "LEAFLOW_EMAIL", "LEAFLOW_PASSWORD"):
+        os.environ.pop(name, None)
+
+    if args.mode == "startup":
+        reports = run_startup(args)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"date": date.today().isoformat(), "startup": reports}, f, ensure_ascii=False, indent=2)
+        return
+
+    sizes = [int(value) for value in args.sizes.split(",") if value.strip()]
+    if args.child:
+        import automatic
+        if not args.verbose:
+            automatic.logger.setLevel(logging.WARNING)
+        print(json.dumps(run_size(automatic, sizes[0], args)))
+        return
+
+    # 每个账号数在单独的子进程中运行
+    reports = []
+    for size in sizes:
+        report = run_size_isolated(size, args)
+        report.update({"mode": args.mode, "concurrency": args.concurrency,
+                       "latency_ms": args.latency_ms, "failure_rate": args.failure_rate})
+        reports.append(report)
+        print(f"[{args.mode}] 账号 {size:>4}: 成功 {report['success']}/{size}, "
+              f"总耗时 {report['wall_s']}s, 吞吐 {report['throughput_per_min']}/min, "
+              f"单账号 p50 {report['latency_p50_s']}s p95 {report['latency_p95_s']}s, "
+              f"Python堆峰值 {report['python_heap_peak_mb']}MB, RSS峰值 {report['peak_rss_mb']}MB "
+              f"(子进程 {report['peak_child_rss_mb']}MB)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"date": date.today().isoformat(), "runs": reports}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()